@@ -0,0 +1,87 @@
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from contextlib import asynccontextmanager
+from common.app import config, database
+from common.logging import get_logger
+from sqlalchemy.engine import URL
+from typing import AsyncIterator, Dict, Tuple
+
+import bot.discord.metrics as metrics
+import time
+
+logger = get_logger("discord_bot.async_database")
+
+# Query options asyncpg understands, anything else in a libpq style url would fail to connect
+ASYNCPG_OPTIONS = {"ssl", "timeout", "command_timeout", "prepared_statement_cache_size"}
+
+# "primary" and "replica" -> (engine, session factory)
+_engines: Dict[str, Tuple[AsyncEngine, async_sessionmaker[AsyncSession]]] = dict()
+
+pool_wait_seconds = metrics.registry.register(metrics.Histogram("discord_db_pool_wait_seconds", "Time spent waiting for a pooled async connection", ("engine",)))
+
+def configure(url, name: str = "primary", **kwargs) -> AsyncEngine:
+    engine = create_async_engine(url, **kwargs)
+    _engines[name] = (engine, async_sessionmaker(engine, expire_on_commit=False))
+    metrics.instrument_engine(engine.sync_engine)
+    return engine
+
+def asyncpg_url(url: URL) -> URL:
+    query = dict(url.query)
+    if "sslmode" in query and "ssl" not in query:
+        query["ssl"] = query.pop("sslmode")
+    if (unsupported := [key for key in query if key not in ASYNCPG_OPTIONS]):
+        logger.warning(f"Dropping options asyncpg doesn't support from the database url: {', '.join(unsupported)}")
+    return url.set(drivername="postgresql+asyncpg", query={key: value for key, value in query.items() if key in ASYNCPG_OPTIONS})
+
+def _get(name: str) -> Tuple[AsyncEngine, async_sessionmaker[AsyncSession]]:
+    if name not in _engines:
+        # Same databases as the sync engines, through asyncpg so queries don't hold up the event loop.
+        # database_async_url/database_async_ro_url override the url derived from the sync engine
+        url = getattr(config, "database_async_ro_url" if name == "replica" else "database_async_url", None)
+        if not url:
+            url = asyncpg_url((database.engine_ro if name == "replica" else database.engine).url)
+        configure(
+            url,
+            name,
+            pool_size=getattr(config, "database_async_pool_size", 10),
+            max_overflow=getattr(config, "database_async_max_overflow", 10),
+            pool_pre_ping=True
+        )
+    return _engines[name]
+
+def get_engine(name: str = "primary") -> AsyncEngine:
+    return _get(name)[0]
+
+async def open_session(name: str = "primary") -> AsyncSession:
+    session = _get(name)[1]()
+    try:
+        start = time.perf_counter()
+        await session.connection()
+        pool_wait_seconds.observe(time.perf_counter() - start, name)
+    except BaseException:
+        await session.close()
+        raise
+    return session
+
+@asynccontextmanager
+async def managed_session(name: str = "primary") -> AsyncIterator[AsyncSession]:
+    session = await open_session(name)
+    try:
+        yield session
+    finally:
+        await session.close()
+
+async def dispose():
+    for engine, _ in _engines.values():
+        await engine.dispose()
+
+def _pool_stats(stat: str) -> Dict[Tuple[str, ...], float]:
+    values = dict()
+    for name, (engine, _) in _engines.items():
+        # Only QueuePool keeps these counters
+        if (get_stat := getattr(engine.pool, stat, None)):
+            values[(name,)] = get_stat()
+    return values
+
+metrics.registry.register(metrics.Gauge("discord_db_pool_size", "Connections the async pool keeps open", ("engine",), lambda: _pool_stats("size")))
+metrics.registry.register(metrics.Gauge("discord_db_pool_checked_out", "Async connections currently in use", ("engine",), lambda: _pool_stats("checkedout")))
+metrics.registry.register(metrics.Gauge("discord_db_pool_overflow", "Async connections opened past the pool size", ("engine",), lambda: _pool_stats("overflow")))
@@ -0,0 +1,41 @@
+from common.database.objects import DBBeatmap
+from common.app import database
+from sqlalchemy.orm import joinedload
+from bot.discord.cache import TTLCache
+from typing import Dict, Iterable
+
+import common.repos.beatmaps as beatmaps
+
+class BeatmapCache:
+
+    # Beatmaps get ranked and updated, so entries expire like the other caches
+    def __init__(self, ttl: float = 3600, maxsize: int = 8192) -> None:
+        self.cache = TTLCache(ttl, maxsize)
+
+    def get_beatmaps(self, ids: Iterable[int]) -> Dict[int, DBBeatmap]:
+        result = dict()
+        missing = list()
+        for beatmap_id in dict.fromkeys(ids):
+            if (beatmap := self.cache.get(beatmap_id)):
+                result[beatmap_id] = beatmap
+            else:
+                missing.append(beatmap_id)
+        if not missing:
+            return result
+        with database.managed_session() as session:
+            query = session.query(DBBeatmap).options(joinedload(DBBeatmap.beatmapset)).filter(DBBeatmap.id.in_(missing))
+            for beatmap in query:
+                result[beatmap.id] = beatmap
+            session.expunge_all()
+        for beatmap_id in missing:
+            if beatmap_id not in result: # Not in the database yet, let the repo fetch it
+                if (beatmap := beatmaps.get_beatmap(beatmap_id)):
+                    result[beatmap_id] = beatmap
+            if beatmap_id in result:
+                self.cache.set(beatmap_id, result[beatmap_id])
+        return result
+
+    def get_beatmap(self, beatmap_id: int) -> DBBeatmap | None:
+        return self.get_beatmaps([beatmap_id]).get(beatmap_id)
+
+beatmap_cache = BeatmapCache()
@@ -0,0 +1,284 @@
+from common.database.objects import DBBotLink, DBBeatmapset, DBBeatmap, DBScore, DBFirstPlace, DBStatsTemp
+from common.app import database
+from sqlalchemy.dialects.postgresql import JSONB, ARRAY
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import StaticPool
+from sqlalchemy import create_engine
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+import bot.discord.async_database as async_database
+import bot.discord.cached_servers as servers
+import tempfile
+import random
+import time
+import os
+
+# SQLite has no JSONB or ARRAY, plain JSON columns behave close enough for the bot's queries
+@compiles(JSONB, "sqlite")
+def _compile_jsonb(type_, compiler, **kw):
+    return "JSON"
+
+@compiles(ARRAY, "sqlite")
+def _compile_array(type_, compiler, **kw):
+    return "JSON"
+
+_EMPTY_VALUES = {int: 0, float: 0.0, str: "", bool: False, dict: dict, list: list, datetime: datetime.now, date: date.today}
+
+def make_row(model, **values):
+    # Fill every non nullable column the benchmark doesn't care about with an empty value
+    for column in model.__table__.columns:
+        if column.name in values or column.nullable or column.default is not None or column.server_default is not None:
+            continue
+        try:
+            empty = _EMPTY_VALUES.get(column.type.python_type, None)
+        except NotImplementedError:
+            empty = None
+        values[column.name] = empty() if callable(empty) else empty
+    return model(**{key: value for key, value in values.items() if key in model.__table__.columns})
+
+def use_sqlite(path: str | None = None):
+    # A file both the sync engine and the aiosqlite engine can open
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="kompir-bench-"), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    DBBotLink.metadata.create_all(engine)
+    async_database.configure(f"sqlite+aiosqlite:///{path}")
+    async_database.configure(f"sqlite+aiosqlite:///{path}", "replica")
+    factory = sessionmaker(engine)
+
+    @contextmanager
+    def managed_session():
+        session = factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    database.engine = engine
+    database.engine_ro = engine
+    database.session = scoped_session(factory)
+    database.managed_session = managed_session
+    return engine
+
+@dataclass
+class FakeUser:
+    id: int
+    username: str
+
+@dataclass
+class FakeStats:
+    server: str
+    user_id: int
+    mode: int
+    relax: int
+    ranked_score: int = 0
+    total_score: int = 0
+    play_count: int = 0
+    play_time: int = 0
+    replays_watched: int = 0
+    accuracy: float = 0.0
+    total_hits: int = 0
+    max_combo: int = 0
+    level: float = 0.0
+    pp: float = 0.0
+    global_rank: int = 0
+    country_rank: int = 0
+
+    def to_db(self) -> "FakeStats":
+        return self
+
+    def copy(self, discord_id: int) -> DBStatsTemp:
+        values = {field.name: getattr(self, field.name) for field in fields(self)}
+        return make_row(DBStatsTemp, discord_id=discord_id, date=datetime.now(), **values)
+
+@dataclass
+class FakeScore:
+    id: int
+    beatmap_id: int
+    user_id: int
+    mode: int
+    relax: int
+    pp: float
+    pp_system: str
+    mods: int = 0
+    score: int = 0
+    accuracy: float = 100.0
+    max_combo: int = 0
+    count_300: int = 0
+    count_100: int = 0
+    count_50: int = 0
+    count_miss: int = 0
+    count_geki: int = 0
+    count_katu: int = 0
+    rank: str = "S"
+    completed: int = 3
+    full_combo: bool = True
+    date: datetime = field(default_factory=datetime.now)
+
+    def get_total_hits(self) -> int:
+        return self.count_300 + self.count_100 + self.count_50 + self.count_miss
+
+class FakeServer:
+
+    def __init__(self, server_name: str, beatmap_ids: List[int], latency: float = 0.05, jitter: float = 0.02, pp_system: str = "benchmark", supports_rx: bool = True) -> None:
+        self.server_name = server_name
+        self.beatmap_ids = beatmap_ids
+        self.latency = latency
+        self.jitter = jitter
+        self.pp_system = pp_system
+        self.supports_rx = supports_rx
+        self.calls = 0
+
+    def _wait(self):
+        self.calls += 1
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def _user_id(self, user: int | str) -> int | None:
+        if isinstance(user, int):
+            return user
+        if user.isdigit():
+            return int(user)
+        if user.startswith("user") and user[4:].isdigit():
+            return int(user[4:])
+
+    def _scores(self, user_id: int, mode: int, relax: int, count: int) -> List[FakeScore]:
+        rng = random.Random(user_id * 8 + mode * 2 + relax)
+        scores = list()
+        for i in range(count):
+            count_300 = rng.randint(300, 2000)
+            count_miss = rng.choice([0, 0, 0, 1, 2, 5])
+            scores.append(FakeScore(
+                id=user_id * 1000 + i, beatmap_id=rng.choice(self.beatmap_ids), user_id=user_id, mode=mode, relax=relax,
+                pp=rng.uniform(100, 800), pp_system=self.pp_system, score=rng.randint(1, 10**8), accuracy=rng.uniform(90, 100),
+                max_combo=rng.randint(100, 2000), count_300=count_300, count_100=rng.randint(0, 50), count_50=rng.randint(0, 10),
+                count_miss=count_miss, full_combo=not count_miss, date=datetime.now() - timedelta(days=rng.randint(0, 1000))
+            ))
+        return sorted(scores, key=lambda score: score.pp, reverse=True)
+
+    def get_user_info(self, user: int | str, mode: int = 0, relax: int = 0) -> Tuple[FakeUser | None, List[FakeStats]]:
+        self._wait()
+        if (user_id := self._user_id(user)) is None:
+            return None, []
+        rng = random.Random(user_id)
+        stats = FakeStats(
+            self.server_name, user_id, mode, relax, ranked_score=rng.randint(0, 10**10), total_score=rng.randint(10**10, 10**11),
+            play_count=rng.randint(0, 10**5), play_time=rng.randint(0, 10**7), accuracy=rng.uniform(90, 100),
+            total_hits=rng.randint(0, 10**7), max_combo=rng.randint(0, 5000), level=rng.uniform(1, 110), pp=rng.uniform(0, 20000),
+            global_rank=rng.randint(1, 10**6), country_rank=rng.randint(1, 10**4)
+        )
+        return FakeUser(user_id, f"user{user_id}"), [stats]
+
+    def get_user_best(self, user_id: int, mode: int, relax: int) -> List[FakeScore]:
+        self._wait()
+        return self._scores(user_id, mode, relax, 100)
+
+    def get_user_recent(self, user_id: int, mode: int, relax: int) -> List[FakeScore]:
+        self._wait()
+        return sorted(self._scores(user_id, mode, relax, 5), key=lambda score: score.date, reverse=True)
+
+    def get_user_pfp(self, user_id: int) -> str:
+        return f"https://a.example.com/{user_id}"
+
+    def get_pp_system(self, mode: int, relax: int) -> str:
+        return self.pp_system
+
+def use_fake_servers(beatmap_ids: List[int], **kwargs) -> List[FakeServer]:
+    fakes = list()
+    for server in servers.servers:
+        fake = FakeServer(server.server_name, beatmap_ids, **kwargs)
+        server.server = fake
+        fakes.append(fake)
+    return fakes
+
+def seed(users: int, beatmaps: int = 500, clears: int = 200, first_places: int = 50) -> List[int]:
+    server_names = [server.server_name for server in servers.servers]
+    rng = random.Random(0)
+    with database.managed_session() as session:
+        for set_id in range(1, beatmaps // 2 + 2):
+            session.add(make_row(DBBeatmapset, id=set_id, title=f"Beatmap {set_id}", artist="Benchmark", creator="Benchmark"))
+        beatmap_ids = list(range(1, beatmaps + 1))
+        for beatmap_id in beatmap_ids:
+            session.add(make_row(
+                DBBeatmap, id=beatmap_id, set_id=beatmap_id // 2 + 1, version="Insane", max_combo=rng.randint(100, 2000),
+                ar=9.0, od=8.0, hp=6.0, cs=4.0, bpm=180.0, status={name: 1 for name in server_names}
+            ))
+        session.flush()
+        # Foreign key from first places to the score they hold
+        score_column = next(fk.parent.name for fk in DBFirstPlace.__table__.foreign_keys if fk.column.table is DBScore.__table__)
+        score_id = 0
+        for user_id in range(1, users + 1):
+            session.add(make_row(
+                DBBotLink, discord_id=user_id, links={name: user_id for name in server_names}, default_server=server_names[0],
+                default_mode=0, default_relax=0, permissions=0, preferences={}
+            ))
+            for i in range(clears):
+                score_id += 1
+                count_miss = rng.choice([0, 0, 1, 3])
+                # A beatmap has one first place per day, hand them out without overlap
+                first_place = i < first_places and (user_id - 1) * first_places + i < beatmaps
+                beatmap_id = beatmap_ids[(user_id - 1) * first_places + i] if first_place else rng.choice(beatmap_ids)
+                session.add(make_row(
+                    DBScore, id=score_id, server=server_names[0], user_id=user_id, mode=0, relax=0, beatmap_id=beatmap_id,
+                    pp=rng.uniform(50, 800), pp_system="benchmark", mods=0, score=rng.randint(1, 10**8), accuracy=rng.uniform(90, 100),
+                    max_combo=rng.randint(100, 2000), count_300=rng.randint(300, 2000), count_100=rng.randint(0, 50),
+                    count_50=rng.randint(0, 10), count_miss=count_miss, rank="S", full_combo=not count_miss,
+                    date=datetime.now() - timedelta(days=rng.randint(0, 1000))
+                ))
+                if first_place:
+                    session.add(make_row(
+                        DBFirstPlace, server=server_names[0], user_id=user_id, mode=0, relax=0, beatmap_id=beatmap_id,
+                        date=date.today(), **{score_column: score_id}
+                    ))
+        session.commit()
+    return beatmap_ids
+
+@dataclass(eq=False)
+class FakeAuthor:
+    id: int
+    name: str
+    roles: List[Any] = field(default_factory=list)
+
+@dataclass(eq=False)
+class FakeGuild:
+    id: int
+    filesize_limit: int = 25 * 1024 * 1024
+
+class FakeMessage:
+
+    def __init__(self, content: str, author: FakeAuthor, guild: FakeGuild | None) -> None:
+        self.content = content
+        self.author = author
+        self.guild = guild
+        self.replies: List[Dict[str, Any]] = list()
+
+    async def reply(self, content: str | None = None, **kwargs) -> "FakeMessage":
+        self.replies.append({'content': content, **kwargs})
+        return FakeMessage(content or "", self.author, self.guild)
+
+    async def edit(self, **kwargs):
+        self.replies.append(kwargs)
+
+    @property
+    def views(self) -> List[Any]:
+        return [reply['view'] for reply in self.replies if reply.get('view')]
+
+class FakeResponse:
+
+    def __init__(self) -> None:
+        self.edits = 0
+
+    async def edit_message(self, **kwargs):
+        self.edits += 1
+
+    async def defer(self, **kwargs):
+        pass
+
+class FakeInteraction:
+
+    def __init__(self, user: FakeAuthor) -> None:
+        self.user = user
+        self.response = FakeResponse()
@@ -0,0 +1,84 @@
+from bot.discord.bot import gateway_options
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+import multiprocessing
+import argparse
+import asyncio
+import resource
+import discord
+import gc
+
+def rss() -> int:
+    # Current RSS in bytes, falls back to the peak where /proc isn't available
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {'id': str(user_id), 'username': f"user{user_id}", 'discriminator': "0", 'global_name': None, 'avatar': None}
+
+def guild_payload(guild_id: int, members: int, channels: int, intents: discord.Intents) -> Dict[str, Any]:
+    # Shaped like GUILD_CREATE, the gateway only sends members and presences when their intents are on
+    base = guild_id * 1_000_000
+    payload = {
+        'id': str(guild_id), 'name': f"guild{guild_id}", 'icon': None, 'owner_id': str(base + 1),
+        'member_count': members, 'large': members > 250, 'features': [], 'emojis': [], 'stickers': [],
+        'roles': [{'id': str(guild_id), 'name': "@everyone", 'permissions': "0", 'position': 0, 'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}],
+        'channels': [
+            {'id': str(base + 500_000 + i), 'type': 0, 'name': f"channel{i}", 'position': i, 'permission_overwrites': [], 'nsfw': False, 'parent_id': None}
+            for i in range(channels)
+        ],
+        'threads': [], 'voice_states': [], 'stage_instances': [], 'guild_scheduled_events': [],
+        'members': [], 'presences': [],
+    }
+    if intents.members:
+        payload['members'] = [
+            {'user': _user(base + i), 'roles': [], 'joined_at': "2020-01-01T00:00:00+00:00", 'deaf': False, 'mute': False}
+            for i in range(members)
+        ]
+    if intents.presences:
+        payload['presences'] = [
+            {'user': {'id': str(base + i)}, 'status': "online", 'activities': [], 'client_status': {'desktop': "online"}}
+            for i in range(0, members, 4)
+        ]
+    return payload
+
+def measure(lean: bool, guilds: int, members: int, channels: int) -> Dict[str, Any]:
+    async def run():
+        client = discord.Client(**gateway_options(lean))
+        state = client._connection
+        gc.collect()
+        before = rss()
+        for guild_id in range(1, guilds + 1):
+            state._add_guild_from_data(guild_payload(guild_id, members, channels, state.intents))
+        gc.collect()
+        cached_members = sum(len(guild._members) for guild in state.guilds)
+        return {'lean': lean, 'guilds': guilds, 'cached_members': cached_members, 'rss_delta': rss() - before}
+    return asyncio.run(run())
+
+def main(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    results = list()
+    # Every measurement gets a fresh process so earlier runs don't inflate the numbers
+    context = multiprocessing.get_context("spawn")
+    for guilds in args.guilds:
+        for lean in (False, True):
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                results.append(pool.submit(measure, lean, guilds, args.members, args.channels).result())
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares gateway cache memory of the default and lean modes over synthetic guilds.")
+    parser.add_argument("--guilds", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--members", type=int, default=200, help="members per guild")
+    parser.add_argument("--channels", type=int, default=20, help="text channels per guild")
+    args = parser.parse_args()
+    print(f"{'guilds':>8}{'mode':>8}{'members':>12}{'RSS MiB':>10}{'KiB/guild':>12}")
+    for result in main(args):
+        mode = "lean" if result['lean'] else "full"
+        print(f"{result['guilds']:>8}{mode:>8}{result['cached_members']:>12}{result['rss_delta'] / 2**20:>10.1f}{result['rss_delta'] / 1024 / result['guilds']:>12.1f}")
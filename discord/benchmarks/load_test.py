@@ -0,0 +1,145 @@
+from bot.discord.benchmarks.fakes import FakeAuthor, FakeGuild, FakeMessage, FakeInteraction, use_sqlite, use_fake_servers, seed
+from bot.discord.dispatch import LoopLagMonitor
+from bot.discord.scheduler import scheduler
+from typing import Dict, List, Tuple
+
+import bot.discord.bot as bot_module
+import statistics
+import argparse
+import asyncio
+import discord
+import random
+import time
+import json
+
+# (weight, command template), {user} is replaced with a random known user
+COMMAND_MIX: List[Tuple[int, str]] = [
+    (30, "!recent"),
+    (20, "!show"),
+    (5, "!show {user}"),
+    (15, "!top"),
+    (5, "!top -nc"),
+    (10, "!showclears"),
+    (5, "!show1s"),
+    (5, "!whatif 400"),
+    (3, "!whatif 2 300 1 500"),
+    (2, "!ping"),
+]
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+class LoadTest:
+
+    def __init__(self, messages: int, concurrency: int, users: int, guilds: int, clicks: int, seed: int) -> None:
+        self.messages = messages
+        self.concurrency = concurrency
+        self.users = users
+        self.guilds = [FakeGuild(guild_id) for guild_id in range(1, guilds + 1)]
+        self.clicks = clicks
+        self.rng = random.Random(seed)
+        self.latencies: Dict[str, List[float]] = dict()
+        self.lag_samples: List[float] = list()
+
+    def _next_message(self) -> FakeMessage:
+        weights, templates = zip(*COMMAND_MIX)
+        template = self.rng.choices(templates, weights)[0]
+        user_id = self.rng.randint(1, self.users)
+        content = template.format(user=f"user{self.rng.randint(1, self.users)}")
+        return FakeMessage(content, FakeAuthor(user_id, f"user{user_id}"), self.rng.choice(self.guilds))
+
+    def _record(self, name: str, elapsed: float):
+        self.latencies.setdefault(name, []).append(elapsed)
+
+    async def _click(self, message: FakeMessage):
+        # Button presses on the views the command replied with, like a user paging through results
+        for view in message.views:
+            buttons = [item for item in view.children if isinstance(item, discord.ui.Button)]
+            for _ in range(self.clicks):
+                button = self.rng.choice(buttons)
+                start = time.perf_counter()
+                await button.callback(FakeInteraction(message.author))
+                self._record(f"{type(view).__module__.split('.')[-1]}.{type(view).__name__}", time.perf_counter() - start)
+
+    async def _send(self, client: bot_module.DiscordBot, slots: asyncio.Semaphore):
+        async with slots:
+            message = self._next_message()
+            start = time.perf_counter()
+            await client.on_message(message)
+            self._record(message.content.split(" ")[0], time.perf_counter() - start)
+            await self._click(message)
+
+    async def _sample_lag(self, monitor: LoopLagMonitor):
+        while True:
+            await asyncio.sleep(monitor.interval)
+            self.lag_samples.append(monitor.lag)
+
+    async def run(self, client: bot_module.DiscordBot) -> dict:
+        monitor = LoopLagMonitor(interval=0.05, warn_threshold=float("inf"))
+        tasks = [asyncio.create_task(monitor.run()), asyncio.create_task(self._sample_lag(monitor))]
+        slots = asyncio.Semaphore(self.concurrency)
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*[self._send(client, slots) for _ in range(self.messages)])
+        finally:
+            elapsed = time.perf_counter() - start
+            for task in tasks:
+                task.cancel()
+        every = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {
+            'messages': self.messages,
+            'seconds': elapsed,
+            'messages_per_second': self.messages / elapsed,
+            'p50': percentile(every, 0.5),
+            'p99': percentile(every, 0.99),
+            'loop_lag_mean': statistics.fmean(self.lag_samples) if self.lag_samples else 0.0,
+            'loop_lag_p99': percentile(self.lag_samples, 0.99),
+            'loop_lag_max': monitor.max_lag,
+            'rejected': scheduler.rejected,
+            'deduplicated': scheduler.deduplicated,
+            'commands': {
+                name: {'count': len(latencies), 'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99)}
+                for name, latencies in sorted(self.latencies.items())
+            },
+        }
+
+def print_report(report: dict):
+    print(f"{report['messages']} messages in {report['seconds']:.2f}s ({report['messages_per_second']:.1f} msg/s)")
+    print(f"latency p50 {report['p50']*1000:.1f}ms, p99 {report['p99']*1000:.1f}ms")
+    print(f"loop lag mean {report['loop_lag_mean']*1000:.1f}ms, p99 {report['loop_lag_p99']*1000:.1f}ms, max {report['loop_lag_max']*1000:.1f}ms")
+    print(f"scheduler rejected {report['rejected']}, deduplicated {report['deduplicated']}")
+    print(f"{'command':<24}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, stats in report['commands'].items():
+        print(f"{name:<24}{stats['count']:>8}{stats['p50']*1000:>10.1f}{stats['p99']*1000:>10.1f}")
+
+async def main(args: argparse.Namespace) -> dict:
+    use_sqlite(args.database)
+    beatmap_ids = seed(args.users, clears=args.clears)
+    use_fake_servers(beatmap_ids, latency=args.latency, jitter=args.jitter, pp_system=args.pp_system)
+    client = bot_module.bot = bot_module.DiscordBot()
+    load_test = LoadTest(args.messages, args.concurrency, args.users, args.guilds, args.clicks, args.seed)
+    return await load_test.run(client)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replays a command mix against DiscordBot.on_message with fake servers and SQLite.")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64, help="messages in flight at once")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--clears", type=int, default=200, help="stored scores per user")
+    parser.add_argument("--clicks", type=int, default=3, help="button presses per view reply")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake server API latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--pp-system", default="benchmark", help="pp version for fake scores, unknown versions skip pp calculation")
+    parser.add_argument("--database", help="SQLite file to use, a temporary one by default")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+    report = asyncio.run(main(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
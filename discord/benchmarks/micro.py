@@ -0,0 +1,159 @@
+from bot.discord.benchmarks.fakes import FakeServer, FakeUser, FakeStats
+from bot.discord.commands.show import ShowCommand, VARIABLE_NAMES, CUSTOM_FORMATTING, format_level, format_playtime
+from bot.discord.commands import Command
+from bot.discord.whatif import WhatIfEngine
+from contextlib import AbstractContextManager, ExitStack, contextmanager
+from unittest.mock import patch
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterator, List
+
+import bot.discord.commands.general as general
+import argparse
+import asyncio
+import random
+import shlex
+import timeit
+import json
+import sys
+import os
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+class StubPPSystem:
+
+    # Cheap stand-in so no-choke benchmarks measure the bot's work rather than the calculator
+    def calculate_pp(self, score) -> float:
+        return score.pp * (1 + score.count_miss * 0.05)
+
+def bench_parse_args() -> Callable[[], object]:
+    command = Command("benchmark")
+    args = ["some_user", "-std_rx", "-server", "akatsuki", "-formatting", "pp|{:.0f}pp/accuracy|{:.2f}%", "-compare_to", "01/01/2024"]
+    return lambda: command._parse_args(args)
+
+def bench_shlex_split() -> Callable[[], object]:
+    content = '!show "some user" -std_rx -server akatsuki -formatting "pp|{:.0f}pp/accuracy|{:.2f}%/level|level"'
+    return lambda: shlex.split(content)
+
+def _large_layout() -> str:
+    fields = list()
+    for name in VARIABLE_NAMES:
+        formatting = name if name in CUSTOM_FORMATTING else "{:,.2f}"
+        reverse = "1" if name.endswith("rank") else ""
+        fields.append(f"{name}|{formatting}|{reverse}")
+    return "/".join(fields)
+
+def bench_get_embed() -> Callable[[], object]:
+    command = ShowCommand()
+    server = FakeServer("benchmark", [1])
+    user = FakeUser(1000, "benchmark")
+    rng = random.Random(0)
+    stats = SimpleNamespace(**{name: rng.uniform(1, 10**6) for name in VARIABLE_NAMES})
+    old_stats = SimpleNamespace(**{name: value * 0.99 for name, value in vars(stats).items()})
+    layout = _large_layout()
+    return lambda: command.get_embed(server, user, stats, old_stats, layout)
+
+@contextmanager
+def bench_no_choke() -> Iterator[Callable[[], object]]:
+    server = FakeServer("benchmark", list(range(1, 501)), latency=0, jitter=0)
+    scores = server.get_user_best(1000, 0, 0)
+    stats = [FakeStats("benchmark", 1000, 0, 0, pp=10000)]
+    beatmaps = {score.beatmap_id: SimpleNamespace(max_combo=2000) for score in scores}
+    pp_system = StubPPSystem()
+
+    async def calculate_fc(items):
+        return [pp_system.calculate_pp(score) for version, score in items]
+
+    async def run():
+        # Views need a running loop to be created
+        view = general.TopView(FakeUser(1000, "benchmark"), stats, scores, True, 0, 0)
+        view.beatmaps = beatmaps
+        await view.no_choke_scores()
+    loop = asyncio.new_event_loop()
+    try:
+        with patch.object(general, "by_version", lambda version: pp_system), patch.object(general, "pp_engine", SimpleNamespace(calculate_fc=calculate_fc)):
+            yield lambda: loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+def bench_whatif() -> Callable[[], object]:
+    rng = random.Random(0)
+    engine = WhatIfEngine([rng.uniform(100, 800) for _ in range(100)])
+    return lambda: (engine.total_with(500, 2), engine.total_with_plays([(2, 300), (1, 500)]), engine.required_pp(100))
+
+def bench_whatif_build() -> Callable[[], object]:
+    rng = random.Random(0)
+    plays = [rng.uniform(100, 800) for _ in range(100)]
+    return lambda: WhatIfEngine(plays).total
+
+def bench_format_level() -> Callable[[], object]:
+    return lambda: format_level(101.4567)
+
+def bench_format_playtime() -> Callable[[], object]:
+    return lambda: (format_playtime(1234567), format_playtime(1234))
+
+# Setups return the function to time, or a context manager yielding it when they patch things that must be undone
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object] | AbstractContextManager]] = {
+    'parse_args': bench_parse_args,
+    'shlex_split': bench_shlex_split,
+    'get_embed_large_layout': bench_get_embed,
+    'no_choke_scores': bench_no_choke,
+    'whatif': bench_whatif,
+    'whatif_build': bench_whatif_build,
+    'format_level': bench_format_level,
+    'format_playtime': bench_format_playtime,
+}
+
+def measure(func: Callable[[], object], repeat: int = 5) -> float:
+    # Best of several runs, in seconds per call
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def load_baselines(path: str) -> Dict[str, float]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def main(args: argparse.Namespace) -> int:
+    if not os.path.exists(args.baseline) and not args.update:
+        print(f"No baselines at {args.baseline}, record them on a known good commit with --update")
+        return 2
+    baselines = load_baselines(args.baseline)
+    results = dict()
+    regressions = list()
+    for name, setup in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        with ExitStack() as stack:
+            if isinstance(func := setup(), AbstractContextManager):
+                func = stack.enter_context(func)
+            results[name] = measure(func, args.repeat)
+        line = f"{name:<26}{results[name]*1e6:>12.2f}us"
+        if (baseline := baselines.get(name)):
+            change = (results[name] - baseline) / baseline * 100
+            line += f"{baseline*1e6:>12.2f}us {change:>+8.1f}%"
+            if change > args.threshold:
+                regressions.append(name)
+                line += "  REGRESSION"
+        else:
+            line += "  no baseline"
+        print(line)
+    if args.update:
+        with open(args.baseline, "w") as f:
+            json.dump({**baselines, **results}, f, indent=2, sort_keys=True)
+        print(f"Baselines written to {args.baseline}")
+        return 0
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the bot's CPU bound hot paths.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="JSON file with seconds per call for each benchmark")
+    parser.add_argument("--threshold", type=float, default=float(os.environ.get("BENCHMARK_THRESHOLD", 20)), help="allowed slowdown in percent")
+    parser.add_argument("--update", action="store_true", help="store the results as the new baselines")
+    parser.add_argument("--filter", help="only run benchmarks containing this string")
+    parser.add_argument("--repeat", type=int, default=5)
+    sys.exit(main(parser.parse_args()))
@@ -5,72 +5,190 @@ from bot.discord.commands.help import ServersCommand, HelpCommand
 from bot.discord.commands.query import DatabaseQueryCommand
 from bot.discord.commands.get_file import GetFileCommand
 from bot.discord.commands.recent import RecentCommand
+from bot.discord.commands.stats import StatsCommand
 from bot.discord.commands.ping import PingCommand
 from bot.discord.commands.user_settings import *
-from bot.discord.commands import Command
+from bot.discord.dispatch import run_blocking, loop_lag
+from bot.discord.cache import prefixes, links, user_ids
+from bot.discord.beatmap_cache import beatmap_cache
+from bot.discord.pp_cache import pp_cache
+from bot.discord.stats_writer import stats_writer
+from bot.discord.scheduler import scheduler, DEDUPLICATED, REJECTED, BUSY
+from bot.discord.commands import Command, CommandRegistry
 from common.app import config, database
 from common.database.objects import *
 from common.logging import get_logger
 from common.service import Service
-from discord import Client
-from typing import List
+from discord import AutoShardedClient
+from typing import List, Set
 
+import bot.discord.async_database as async_database
+import bot.discord.cached_servers as servers
+import bot.discord.commands.show as show
+import bot.discord.pp_engine as pp_engine
+import bot.discord.sharding as sharding
+import bot.discord.metrics as metrics
+import bot.discord.indexes as indexes
+import threading
+import asyncio
+import time
 import discord
 import shlex
 
-class DiscordBot(Client):
+def gateway_options(lean: bool) -> dict:
+    if not lean:
+        return {'intents': discord.Intents.all()}
+    # Commands only need messages, their content and the guilds they come from, interactions are always delivered
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.dm_messages = True
+    intents.message_content = True
+    return {
+        'intents': intents,
+        'member_cache_flags': discord.MemberCacheFlags.none(),
+        'chunk_guilds_at_startup': False,
+        'max_messages': None,
+    }
+
+class DiscordBot(AutoShardedClient):
     
-    def __init__(self):
-        self.commands = self.get_commands()
+    # Without shard_ids/shard_count Discord's recommended shard count is used, all in this process
+    # primary is false for sharded workers after the first, they leave shared files to it
+    def __init__(self, lean: bool | None = None, primary: bool = True, **kwargs):
+        self.primary = primary
+        if lean is None:
+            lean = getattr(config, "discord_lean_gateway", False)
+        self.registry = CommandRegistry([PingCommand(), LinkCommand(), SetDefaultModeCommand(), SetDefaultServerCommand(), RecentCommand(), ServersCommand(), DatabaseQueryCommand(), ShowCommand(), SetPrefixCommand(), HelpCommand(), GetFileCommand(), WhatIfCommand(), TopCommand(), ShowClearsCommand(), Show1sCommand(), LayoutCommand(), StatsCommand()])
         self.logger = get_logger("discord_bot")
-        super().__init__(intents=discord.Intents.all())
+        self.running: Set[asyncio.Task] = set()
+        super().__init__(**gateway_options(lean), **kwargs)
+
+    async def setup_hook(self):
+        # Before connecting, shards that are ready early already get messages
+        await run_blocking(prefixes.warm)
+        await run_blocking(pp_cache.load)
+        self.loop_lag_task = asyncio.create_task(loop_lag.run())
+        if not self.shard_ids or 0 in self.shard_ids: # One process is enough to build indexes
+            self.index_task = asyncio.create_task(run_blocking(indexes.ensure_indexes))
+
+    async def close(self):
+        for task in list(self.running):
+            task.cancel()
+        if self.primary:
+            await run_blocking(pp_cache.save)
+        await run_blocking(stats_writer.flush)
+        await async_database.dispose()
+        pp_engine.shutdown()
+        await super().close()
 
     async def on_ready(self):
+        await run_blocking(prefixes.warm) # Refresh after reconnects
         print(f'Logged on as {self.user}!')
 
     async def on_message(self, message: discord.Message):
         if message.author == self.user:
             return
-        prefix = "!"
-        with database.managed_session() as session:
-            if (preferences := session.get(DBServerPreferences, message.guild.id)):
-                prefix = preferences.prefix
+        prefix = prefixes.get(message.guild)
         if message.content.startswith(prefix):
             split = shlex.split(message.content)
             command = split[0][len(prefix):]
             args = split[1:]
-            for cmd in self.commands:
-                if cmd.name == command or command in cmd.aliases:
-                    self.logger.info(f"{message.author.name} ({message.author.id}): {message.content}")
-                    if cmd.permission_level > 0:
-                        link = cmd._get_link(message)
-                        if not link:
-                            await cmd._msg_no_permission(message)
-                            return
-                        if link.permissions < cmd.permission_level:
-                            await cmd._msg_no_permission(message)
-                            return
-                    try:
-                        await cmd.run(message, args)
-                    except Exception as e:
-                        error_embed = discord.Embed(title=f"An error has occurred! ({type(e).__name__})")
-                        error_embed.description = f"```{e}```"
-                        self.logger.error(f"Unhandled exception in command {cmd.name}!", exc_info=e)
-                        error_embed.set_footer(text="Error has been reported automatically. No further action is required.")
-                        await message.reply(embed=error_embed)
-                    return
+            if (cmd := self.registry.get(command)):
+                self.logger.info(f"{message.author.name} ({message.author.id}): {message.content}")
+                if cmd.permission_level > 0:
+                    link = await run_blocking(cmd._get_link, message)
+                    if not link:
+                        await cmd._msg_no_permission(message)
+                        return
+                    if link.permissions < cmd.permission_level:
+                        await cmd._msg_no_permission(message)
+                        return
+                key = (message.author.id, cmd.name, tuple(args))
+                guild_id = message.guild.id if message.guild else None
+                result = await scheduler.submit(key, message.author.id, guild_id, cmd.is_heavy(args), lambda: self._run_command(cmd, message, args))
+                if result == DEDUPLICATED:
+                    await message.reply("That command is already running, its reply covers this one too!")
+                elif result == REJECTED:
+                    await message.reply("You have too many commands running, wait for them to finish!")
+                elif result == BUSY:
+                    await message.reply("The bot is busy right now, try again in a moment!")
+                return
             await message.reply("Unknown command!")
     
+    async def _run_command(self, cmd: Command, message: discord.Message, args: List[str]):
+        task = asyncio.current_task()
+        self.running.add(task)
+        metrics.current_command.set(cmd.name)
+        message = metrics.TimedMessage(message)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(cmd.run(message, args), timeout=cmd.timeout)
+        except asyncio.TimeoutError:
+            metrics.command_errors.inc(cmd.name, "TimeoutError")
+            self.logger.warning(f"Command {cmd.name} timed out after {cmd.timeout}s")
+            await message.reply("Command timed out! Try again later.")
+        except Exception as e:
+            metrics.command_errors.inc(cmd.name, type(e).__name__)
+            error_embed = discord.Embed(title=f"An error has occurred! ({type(e).__name__})")
+            error_embed.description = f"```{e}```"
+            self.logger.error(f"Unhandled exception in command {cmd.name}!", exc_info=e)
+            error_embed.set_footer(text="Error has been reported automatically. No further action is required.")
+            await message.reply(embed=error_embed)
+        finally:
+            metrics.command_seconds.observe(time.perf_counter() - start, cmd.name)
+            self.running.discard(task)
+
     def get_commands(self) -> List[Command]:
-        return [PingCommand(), LinkCommand(), SetDefaultModeCommand(), SetDefaultServerCommand(), RecentCommand(), ServersCommand(), DatabaseQueryCommand(), ShowCommand(), SetPrefixCommand(), HelpCommand(), GetFileCommand(), WhatIfCommand(), TopCommand(), ShowClearsCommand(), Show1sCommand()]
+        return self.registry.commands
 
 bot: DiscordBot = None
 
+def _register_metrics():
+    metrics.register_cache("links", lambda: (links.cache.hits, links.cache.misses))
+    metrics.register_cache("user_ids", lambda: (user_ids.hits, user_ids.misses))
+    metrics.register_cache("beatmaps", lambda: (beatmap_cache.cache.hits, beatmap_cache.cache.misses))
+    metrics.register_cache("pp", lambda: (pp_cache.hits, pp_cache.misses))
+    metrics.register_cache("show_counts", lambda: (show.counts.hits, show.counts.misses))
+    for server in servers.servers:
+        for endpoint, cache in server.caches.items():
+            metrics.register_cache(f"{server.server_name}_{endpoint}", lambda cache=cache: (cache.hits, cache.misses))
+    metrics.register_gauge("discord_loop_lag_seconds", "Last measured event loop lag", lambda: loop_lag.lag)
+    metrics.register_gauge("discord_loop_lag_max_seconds", "Worst event loop lag since startup", lambda: loop_lag.max_lag)
+    metrics.register_gauge("discord_commands_running", "Commands currently running", lambda: sum(scheduler.user_running.values()))
+    metrics.register_counter("discord_commands_deduplicated_total", "Commands folded into an identical running one", lambda: scheduler.deduplicated)
+    metrics.register_counter("discord_commands_rejected_total", "Commands rejected by the per-user limit or a full guild or heavy lane", lambda: scheduler.rejected)
+    metrics.register_gauge("discord_pp_cache_size", "Entries in the pp cache", lambda: len(pp_cache.entries))
+    metrics.register_counter("discord_pp_time_spent_seconds_total", "Time spent calculating pp", lambda: pp_cache.time_spent)
+    metrics.register_counter("discord_pp_time_saved_seconds_total", "Calculation time saved by the pp cache", lambda: pp_cache.time_saved)
+
+def run_bot(metrics_port: int | None = None, primary: bool = True, **kwargs):
+    global bot
+    _register_metrics()
+    metrics.instrument_engine(database.engine)
+    metrics.instrument_engine(database.engine_ro)
+    # Prometheus scrape endpoint, local only since it isn't authenticated
+    if metrics_port:
+        metrics.serve(getattr(config, "discord_metrics_host", "127.0.0.1"), metrics_port)
+    stop = threading.Event()
+    # Flushes !show snapshots in batches and bulk deletes expired ones
+    writer = threading.Thread(target=stats_writer.run, args=(stop,), kwargs={'sweep_interval': 600 if primary else None}, name="stats_writer", daemon=True)
+    writer.start()
+    try:
+        bot = DiscordBot(primary=primary, **kwargs)
+        bot.run(config.discord_token)
+    finally:
+        stop.set()
+        writer.join()
+
 class DiscordBotService(Service):
     def __init__(self):
         super().__init__("discord_bot", daemonize=True)
 
     def run(self):
-        global bot
-        bot = DiscordBot()
-        bot.run(config.discord_token)
\ No newline at end of file
+        processes = getattr(config, "discord_processes", 1)
+        shard_count = getattr(config, "discord_shard_count", None)
+        if processes > 1:
+            sharding.launch(processes, shard_count)
+        else:
+            run_bot(getattr(config, "discord_metrics_port", 9464), shard_count=shard_count)
@@ -0,0 +1,105 @@
+from common.database.objects import DBServerPreferences, DBBotLink
+from common.app import database
+from collections import OrderedDict
+from sqlalchemy import inspect
+from typing import Any, Callable, Dict, Hashable, List
+
+import threading
+import discord
+import copy
+import time
+
+MISSING = object()
+
+class TTLCache:
+
+    def __init__(self, ttl: float, maxsize: int = 1024) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class PrefixCache:
+
+    def __init__(self, default: str = "!") -> None:
+        self.default = default
+        self.prefixes: Dict[int, str] = {}
+        # Called with (guild_id, prefix) on local changes, so other processes can follow
+        self.listeners: List[Callable[[int, str], None]] = []
+
+    def warm(self):
+        with database.managed_session() as session:
+            self.prefixes = {x.guild_id: x.prefix for x in session.query(DBServerPreferences)}
+
+    def get(self, guild: discord.Guild | None) -> str:
+        if guild is None: # DMs always use the default prefix
+            return self.default
+        return self.prefixes.get(guild.id, self.default)
+
+    def set(self, guild_id: int, prefix: str, notify: bool = True):
+        self.prefixes[guild_id] = prefix
+        if notify:
+            for listener in self.listeners:
+                listener(guild_id, prefix)
+
+class LinkCache:
+
+    def __init__(self, ttl: float = 300, negative_ttl: float = 60, maxsize: int = 4096) -> None:
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(ttl, maxsize)
+        # Called with the discord id on local invalidations, so other processes can follow
+        self.listeners: List[Callable[[int], None]] = []
+
+    def get(self, discord_id: int) -> DBBotLink | None:
+        link = self.cache.get(discord_id, MISSING)
+        if link is MISSING:
+            with database.managed_session() as session:
+                link = session.get(DBBotLink, discord_id)
+            # Cache unlinked users too, but for less time so !link feels instant elsewhere
+            self.cache.set(discord_id, link, ttl=None if link else self.negative_ttl)
+        # Commands edit the link before saving it, so they get their own copy and
+        # the cached one only changes once the save has committed and invalidated it
+        return self._copy(link) if link else link
+
+    def _copy(self, link: DBBotLink) -> DBBotLink:
+        return DBBotLink(**{attr.key: copy.deepcopy(getattr(link, attr.key)) for attr in inspect(DBBotLink).column_attrs})
+
+    def invalidate(self, discord_id: int, notify: bool = True):
+        self.cache.invalidate(discord_id)
+        if notify:
+            for listener in self.listeners:
+                listener(discord_id)
+
+prefixes = PrefixCache()
+links = LinkCache()
+# (server name, lowercase username) -> user id, usernames rarely change
+user_ids = TTLCache(ttl=3600, maxsize=16384)
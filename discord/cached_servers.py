@@ -0,0 +1,83 @@
+from common.api.server_api import ServerAPI
+from bot.discord.cache import TTLCache, MISSING
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+
+import bot.discord.metrics as metrics
+import common.servers
+import threading
+
+class CachedServer:
+
+    # Seconds each endpoint's responses stay fresh, recent plays have to stay snappy
+    ttls = {
+        'get_user_info': 60,
+        'get_user_best': 120,
+        'get_user_recent': 5,
+    }
+
+    def __init__(self, server: ServerAPI, maxsize: int = 2048) -> None:
+        self.server = server
+        self.caches = {endpoint: TTLCache(ttl, maxsize) for endpoint, ttl in self.ttls.items()}
+        self.in_flight: Dict[Tuple, Future] = {}
+        self.lock = threading.Lock()
+        self.coalesced = 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.server, name)
+
+    def _fetch(self, endpoint: str, *args, **kwargs) -> Any:
+        cache = self.caches[endpoint]
+        key = (args, tuple(sorted(kwargs.items())))
+        if (result := cache.get(key, MISSING)) is not MISSING:
+            return result
+        with self.lock:
+            future = self.in_flight.get((endpoint, key))
+            leader = future is None
+            if leader:
+                future = self.in_flight[(endpoint, key)] = Future()
+            else:
+                self.coalesced += 1
+        if not leader: # Someone else is already asking the server for this
+            return future.result()
+        try:
+            with metrics.phase("server_api"), metrics.server_api_seconds.time(self.server.server_name, endpoint):
+                result = getattr(self.server, endpoint)(*args, **kwargs)
+            # Don't remember misses, a user who just registered or set a play shouldn't wait out the ttl
+            if not self._is_empty(result):
+                cache.set(key, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[(endpoint, key)]
+
+    def _is_empty(self, result: Any) -> bool:
+        if isinstance(result, tuple): # get_user_info returns (user, stats)
+            return not result or not result[0]
+        return not result
+
+    def get_user_info(self, *args, **kwargs) -> Tuple[Any, List[Any]]:
+        return self._fetch('get_user_info', *args, **kwargs)
+
+    # Callers sort these lists in place, hand out copies so the cached order stays intact
+    def get_user_best(self, *args, **kwargs) -> List[Any]:
+        result = self._fetch('get_user_best', *args, **kwargs)
+        return list(result) if result else result
+
+    def get_user_recent(self, *args, **kwargs) -> List[Any]:
+        result = self._fetch('get_user_recent', *args, **kwargs)
+        return list(result) if result else result
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        return {endpoint: {'hits': cache.hits, 'misses': cache.misses} for endpoint, cache in self.caches.items()}
+
+servers = [CachedServer(server) for server in common.servers.servers]
+_by_name = {server.server_name: server for server in servers}
+
+def by_name(name: str) -> CachedServer | None:
+    if (server := common.servers.by_name(name)):
+        return _by_name.get(server.server_name)
@@ -1,12 +1,51 @@
 from common.database.objects import DBBotLink
-from common.app import database
+from common.api.server_api import User, Stats
+from bot.discord.cache import links, user_ids
+from bot.discord.dispatch import run_blocking
 
 from discord import Message
 
+from dataclasses import dataclass
 from enum import IntEnum
-from typing import Dict, List, Tuple
+from typing import Any, Dict, List, Tuple
 
-import common.servers as servers
+import bot.discord.async_database as async_database
+import bot.discord.cached_servers as servers
+
+MODES = {
+    'std': (0, 0),
+    'std_rx': (0, 1),
+    'std_ap': (0, 2),
+    'taiko': (1, 0),
+    'taiko_rx': (1, 1),
+    'ctb': (2,0),
+    'ctb_rx': (2, 1),
+    'mania': (3, 0),
+}
+
+MODE_NAMES = {
+    0: 'Standard',
+    1: 'Taiko',
+    2: 'Ctb',
+    3: 'Mania'
+}
+
+RELAX_NAMES = {
+    0: '',
+    1: 'Relax',
+    2: 'Autopilot'
+}
+
+SERVER_NAMES = frozenset(server.server_name for server in servers.servers)
+
+@dataclass
+class CommandContext:
+    server: Any
+    user: User
+    stats: List[Stats]
+    mode: int
+    relax: int
+    link: DBBotLink | None
 
 class PermissionLevelEnum(IntEnum):
     
@@ -16,47 +55,37 @@ class PermissionLevelEnum(IntEnum):
     
 class Command:
     
-    def __init__(self, name: str, description = "No description provided.", help = "No help provided.", aliases: List[str] = [], permission_level: PermissionLevelEnum = PermissionLevelEnum.USER) -> None:
+    def __init__(self, name: str, description = "No description provided.", help = "No help provided.", aliases: List[str] = [], permission_level: PermissionLevelEnum = PermissionLevelEnum.USER, timeout: float = 30, heavy: bool = False) -> None:
         self.name = name
         self.description = description
         self.help = help
         self.aliases = aliases
         self.permission_level = permission_level
+        self.timeout = timeout
+        self.heavy = heavy
     
+    def is_heavy(self, args: List[str]) -> bool:
+        return self.heavy
+
     def _get_modes(self) -> Dict[str, Tuple[int, int]]:
-        return {
-            'std': (0, 0),
-            'std_rx': (0, 1),
-            'std_ap': (0, 2),
-            'taiko': (1, 0),
-            'taiko_rx': (1, 1),
-            'ctb': (2,0),
-            'ctb_rx': (2, 1),
-            'mania': (3, 0),
-        }
+        return MODES
 
     def _get_mode_full_name(self, mode: int, relax: int):
-        modes = {
-            0: 'Standard',
-            1: 'Taiko',
-            2: 'Ctb',
-            3: 'Mania'
-        }
-        relaxs = {
-            0: '',
-            1: 'Relax',
-            2: 'Autopilot'
-        }
-        return f'{modes[mode]} {relaxs[relax]}'.strip()
+        return f'{MODE_NAMES[mode]} {RELAX_NAMES[relax]}'.strip()
     
     def _get_mode_from_string(self, string: str) -> Tuple[int, int] | None:
-        modes = self._get_modes()
-        if string in modes:
-            return modes[string]
+        return MODES.get(string)
 
     def _get_link(self, message: Message) -> DBBotLink:
-        with database.managed_session() as session:
-            return session.get(DBBotLink, message.author.id)
+        return links.get(message.author.id)
+
+    async def _save_link(self, link: DBBotLink):
+        try:
+            async with async_database.managed_session() as session:
+                await session.merge(link)
+                await session.commit()
+        finally:
+            links.invalidate(link.discord_id)
 
     async def _msg_not_linked(self, message: Message):
         await message.reply("This command requires a link! Use !link <username> <server> to link your account.")
@@ -65,14 +94,12 @@ class Command:
         await message.reply("You do not have permission to use this command!")
 
     def _parse_args(self, args: List[str]) -> dict:
-        modes = self._get_modes()
-        server_names = [x.server_name for x in servers.servers]
         result = {'default': list()}
         prev = None
         def handle_shortcuts():
-            if prev in modes:
-                result['mode'] = modes[prev]
-            elif prev in server_names:
+            if prev in MODES:
+                result['mode'] = MODES[prev]
+            elif prev in SERVER_NAMES:
                 result['server'] = prev
             else:
                 result[prev] = None
@@ -91,6 +118,67 @@ class Command:
             handle_shortcuts()
         return result
 
+    def _get_user_info(self, server, username: str | int, mode: int, relax: int) -> Tuple[User | None, List[Stats]]:
+        key = (server.server_name, str(username).lower())
+        user, stats = server.get_user_info(user_ids.get(key, username), mode, relax)
+        if user:
+            # Lookups by name and by id end up on the same cached response from now on
+            user_ids.set(key, user.id)
+        return user, stats
+
+    async def _resolve_context(self, message: Message, parsed: dict) -> CommandContext | None:
+        server = None
+        username = parsed['default'][0] if parsed['default'] else 0
+        mode, relax = parsed.get('mode', (0, 0))
+
+        if 'server' in parsed:
+            server = servers.by_name(parsed['server'])
+            if not server:
+                await message.reply(f"Unknown server! Use !servers to see available servers.")
+                return
+
+        link = await run_blocking(self._get_link, message)
+        if link:
+            if not server:
+                server = servers.by_name(link.default_server)
+            if not username:
+                username = link.links.get(server.server_name)
+            if not 'mode' in parsed:
+                mode = link.default_mode
+                relax = link.default_relax
+        if not username:
+            await self._msg_not_linked(message)
+            return
+
+        if not server:
+            server = servers.by_name("akatsuki")
+
+        user, stats = await run_blocking(self._get_user_info, server, username, mode, relax)
+        if not user:
+            await message.reply(f"User not found on {server.server_name}!")
+            return
+
+        return CommandContext(server, user, stats, mode, relax, link)
+
     async def run(self, message: Message, args: List[str]):
         pass
 
+class CommandRegistry:
+
+    def __init__(self, commands: List[Command] = []) -> None:
+        self.commands: List[Command] = []
+        self.index: Dict[str, Command] = {}
+        for command in commands:
+            self.register(command)
+
+    def register(self, command: Command):
+        for name in [command.name, *command.aliases]:
+            if name in self.index:
+                raise ValueError(f"Command name {name} of {command.name} collides with {self.index[name].name}!")
+        for name in [command.name, *command.aliases]:
+            self.index[name] = command
+        self.commands.append(command)
+
+    def get(self, name: str) -> Command | None:
+        return self.index.get(name)
+
@@ -1,63 +1,79 @@
-import io
 from common.database.objects import DBBeatmapset, DBBeatmap
-from sqlalchemy import Integer
-from common.app import database
+from sqlalchemy import select
 from discord import File, Message
+from bot.discord.dispatch import run_blocking
+from bot.discord.indexes import custom_ranked_filter
+from bot.discord.read_routing import read_session
+from bot.discord.export import ExportResult, EXTENSIONS, write_columnar, write_delimited
 from typing import List
 
 from . import Command
 
+import bot.discord.cached_servers as servers
+
+FORMATS = {
+    'tsv': '\t',
+    'csv': ',',
+    'parquet': None,
+    'arrow': None,
+}
+
+def _python_type(column) -> type | None:
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
 class GetFileCommand(Command):
     def __init__(self) -> None:
-        super().__init__("getfile", "Get private server custom beatmaps", "Usage: !getfile <server> <beatmapsets/beatmaps> [status_integer]")
-
-    def _generate_beatmaps_tsv(self, server: str, status: int | None = None):
-        tsv = ""
-        with database.managed_session() as session:
-            query = session.query(DBBeatmap).filter(DBBeatmap.status[server].astext.cast(Integer) != DBBeatmap.status["bancho"].astext.cast(Integer))
-            if status is not None:
-                query = query.filter(DBBeatmap.status[server].astext.cast(Integer) == status)
-            else:
-                query = query.filter(DBBeatmap.status[server].astext.cast(Integer) > 0)
-            beatmap = query.first()
-            if not beatmap:
-                return "" # Something wrong happened
-            if not tsv:
-                tsv += "\t".join([str(x) for x in beatmap.__dict__.keys() if not x.startswith("_")]) + "\n"
-            for beatmap in query:
-                tsv += "\t".join([str(v) for k,v in beatmap.__dict__.items() if not k.startswith("_")]) + "\n"
-        return tsv
-
-    def _generate_beatmapsets_tsv(self, server: str, status: int | None = None):
-        tsv = ""
-        with database.managed_session() as session:
-            query = session.query(DBBeatmapset).join(DBBeatmap).filter(DBBeatmap.status[server].astext.cast(Integer) != DBBeatmap.status["bancho"].astext.cast(Integer))
-            if status is not None:
-                query = query.filter(DBBeatmap.status[server].astext.cast(Integer) == status)
-            else:
-                query = query.filter(DBBeatmap.status[server].astext.cast(Integer) > 0)
-            beatmapset = query.first()
-            if not beatmapset:
-                return "" # Something wrong happened
-            if not tsv:
-                tsv += "\t".join([str(x) for x in beatmapset.__dict__.keys() if not x.startswith("_")]) + "\n"
-            for beatmapset in query:
-                tsv += "\t".join([str(v) for k,v in beatmapset.__dict__.items() if not k.startswith("_")]) + "\n"
-        return tsv
+        super().__init__("getfile", "Get private server custom beatmaps", "Usage: !getfile <server> <beatmapsets/beatmaps> [status_integer] [-format tsv/csv/parquet/arrow]", timeout=120, heavy=True)
+
+    def _export(self, table, statement, format: str) -> ExportResult:
+        columns = list(table.columns)
+        header = [column.name for column in columns]
+        with read_session() as session:
+            # Plain tuples straight from a server side cursor, no ORM objects are built
+            rows = session.execute(statement, execution_options={'stream_results': True, 'yield_per': 1000})
+            if FORMATS[format] is None:
+                return write_columnar(header, [_python_type(column) for column in columns], rows, format)
+            return write_delimited(header, rows, delimiter=FORMATS[format])
 
+    def _generate_beatmaps_file(self, server: str, status: int | None = None, format: str = "tsv") -> ExportResult:
+        table = DBBeatmap.__table__
+        statement = select(*table.columns).where(*custom_ranked_filter(server, status))
+        return self._export(table, statement, format)
+
+    def _generate_beatmapsets_file(self, server: str, status: int | None = None, format: str = "tsv") -> ExportResult:
+        table = DBBeatmapset.__table__
+        beatmapset_ids = select(DBBeatmap.set_id).where(*custom_ranked_filter(server, status))
+        statement = select(*table.columns).where(table.c.id.in_(beatmapset_ids))
+        return self._export(table, statement, format)
 
     async def run(self, message: Message, args: List[str]):
-        if len(args) < 2:
-            await message.reply("Usage: !getfile <server> <beatmapsets/beatmaps> [status_integer]")
+        format = 'tsv'
+        if '-format' in args: # Parsed by hand, negative statuses would look like flags
+            index = args.index('-format')
+            format = args[index+1] if len(args) > index+1 else ''
+            args = args[:index] + args[index+2:]
+        if len(args) < 2 or format not in FORMATS or (len(args) == 3 and not args[2].lstrip('-').isdigit()):
+            await message.reply(self.help)
+            return
+        if not servers.by_name(args[0]):
+            await message.reply(f"Unknown server: {args[0]}! Use !servers to see available servers.")
             return
+        status = int(args[2]) if len(args) == 3 else None
         if args[1] == "beatmapsets":
-            tsv = self._generate_beatmapsets_tsv(args[0], args[2] if len(args) == 3 else None)
+            result = await run_blocking(self._generate_beatmapsets_file, args[0], status, format)
         elif args[1] == "beatmaps":
-            tsv = self._generate_beatmaps_tsv(args[0], args[2] if len(args) == 3 else None)
+            result = await run_blocking(self._generate_beatmaps_file, args[0], status, format)
         else:
-            await message.reply("Usage: !getfile <server> <beatmapsets/beatmaps> [status_integer]")
-            return
-        if not tsv:
-            await message.reply("No beatmaps found!")
+            await message.reply(self.help)
             return
-        await message.reply(file=File(io.StringIO(tsv), filename=f"{args[2]}.tsv"))
\ No newline at end of file
+        with result.file:
+            if not result.rows:
+                await message.reply("No beatmaps found!")
+                return
+            filename = f"{args[0]}_{args[1]}{f'_{status}' if status is not None else ''}.{format}"
+            if FORMATS[format] is not None:
+                filename += EXTENSIONS['gzip']
+            await message.reply(f"{result.rows:,} {args[1]}", file=File(result.file, filename=filename))
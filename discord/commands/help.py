@@ -1,18 +1,37 @@
 from discord import Message, Embed
-from typing import List
+from typing import Dict, List
 from . import Command
 
-import common.servers as servers
+import bot.discord.cached_servers as servers
 import discord
 
+# Help menu is static once commands are registered, build it only once
+_help_embed: Embed | None = None
+_select_options: List[discord.SelectOption] = []
+_command_embeds: Dict[str, Embed] = {}
+
+def _build_help():
+    global _help_embed, _select_options
+    from bot.discord.bot import bot # Avoid circular import...
+    content = ""
+    options = list()
+    for command in bot.get_commands():
+        content += f"{command.name} | {command.description}\n"
+        options.append(discord.SelectOption(label=command.name, description=command.description))
+        _command_embeds[command.name] = Embed(title=f"{command.name}", description=f"Aliases: {', '.join(command.aliases)}\n{command.description}\n{command.help}")
+    _select_options = options
+    _help_embed = Embed(title="Help", description=content)
+
+def get_help_embed() -> Embed:
+    if _help_embed is None:
+        _build_help()
+    return _help_embed
+
 class Select(discord.ui.Select):
     def __init__(self, callback_function):
-        from bot.discord.bot import bot # Avoid circular import...
         self.callback_function = callback_function
-        options = list()
-        for command in bot.get_commands():
-            options.append(discord.SelectOption(label=command.name, description=command.description))
-        super().__init__(placeholder="Select an option",max_values=1,min_values=1,options=options)
+        get_help_embed()
+        super().__init__(placeholder="Select an option",max_values=1,min_values=1,options=list(_select_options))
     
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer()
@@ -24,18 +43,11 @@ class SelectView(discord.ui.View):
         self.add_item(Select(self.callback_function))
 
     async def callback_function(self, command_name):
-        from bot.discord.bot import bot # Avoid circular import...
-        for command in bot.get_commands():
-            if command.name == command_name:
-                await self.message.edit(embed=Embed(title=f"{command.name}", description=f"Aliases: {', '.join(command.aliases)}\n{command.description}\n{command.help}"))
-                return
+        if (embed := _command_embeds.get(command_name)):
+            await self.message.edit(embed=embed)
     
     async def reply(self, message: Message):
-        from bot.discord.bot import bot # Avoid circular import...
-        content = ""
-        for command in bot.get_commands():
-            content += f"{command.name} | {command.description}\n"
-        self.message = await message.reply(embed=Embed(title="Help", description=content), view=self)
+        self.message = await message.reply(embed=get_help_embed(), view=self)
 
 class HelpCommand(Command):
     
@@ -1,24 +1,44 @@
 from . import PermissionLevelEnum, Command
+from bot.discord.dispatch import run_blocking
+from bot.discord.export import ExportResult, EXTENSIONS, write_delimited
 
 from discord import Message, File
 from sqlalchemy import text
 from typing import List
 
 import common.app as app
-import io
 
 class DatabaseQueryCommand(Command):
     
     def __init__(self) -> None:
-        super().__init__("query", "query the database", permission_level=PermissionLevelEnum.ADVANCED)
+        self.statement_timeout = getattr(app.config, "query_statement_timeout", 60)
+        self.max_rows = getattr(app.config, "query_max_rows", 1000000)
+        self.compression = getattr(app.config, "query_compression", "gzip")
+        super().__init__("query", "query the database", permission_level=PermissionLevelEnum.ADVANCED, timeout=self.statement_timeout + 30, heavy=True)
         
-    async def run(self, message: Message, args: List[str]):
+    def _execute(self, query: str) -> ExportResult:
         with app.database.engine_ro.connect() as conn:
-            tsv = ""
-            try:
-                rs = conn.execute(text(" ".join(message.content.split(" ")[1:])))
-                for row in rs:
-                    tsv += "\t".join([str(x) for x in row]) + "\n"
-                await message.reply(file=File(io.StringIO(tsv), filename="query.tsv"))
-            except Exception as e:
-                await message.reply(f"Query error: {repr(e)}")
\ No newline at end of file
+            with conn.begin():
+                if conn.dialect.name == "postgresql":
+                    conn.execute(text(f"SET LOCAL statement_timeout = {int(self.statement_timeout * 1000)}"))
+                # Server side cursor, rows are fetched and written out in batches
+                rs = conn.execution_options(stream_results=True, yield_per=1000).execute(text(query))
+                if not rs.returns_rows:
+                    return write_delimited([], [], compression=self.compression)
+                return write_delimited(list(rs.keys()), rs, compression=self.compression, max_rows=self.max_rows)
+
+    async def run(self, message: Message, args: List[str]):
+        try:
+            result = await run_blocking(self._execute, " ".join(message.content.split(" ")[1:]))
+        except Exception as e:
+            await message.reply(f"Query error: {repr(e)}")
+            return
+        with result.file:
+            limit = message.guild.filesize_limit if message.guild else 25 * 1024 * 1024
+            summary = f"{result.rows:,} rows, {result.raw_bytes:,} bytes ({result.compressed_bytes:,} bytes compressed)"
+            if result.truncated:
+                summary += f", truncated at {self.max_rows:,} rows"
+            if result.compressed_bytes > limit:
+                await message.reply(f"Result is too big to upload! {summary}")
+                return
+            await message.reply(summary, file=File(result.file, filename=f"query.tsv{EXTENSIONS[self.compression]}"))
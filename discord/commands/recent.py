@@ -1,19 +1,37 @@
 from common.database.objects import DBBeatmap, DBMapPlaycount
-from common.performance import by_version, SimulatedScore
+from common.performance import by_version
 from common.constants import Mods, BeatmapStatus
 from common.utils import MapStats
 
 from discord import Embed, Message, Color
+from sqlalchemy.orm import joinedload
+from bot.discord.dispatch import run_blocking
+from bot.discord.read_routing import async_read_session
 from typing import List
 from . import Command
 
-import common.servers as servers
-import common.app as app
+import bot.discord.cached_servers as servers
+import bot.discord.pp_engine as pp_engine
 
 class RecentCommand(Command):
     
     def __init__(self):
         super().__init__("recent", "Show recent play on a user")
+
+    async def _load_play_details(self, server, user, play):
+        total_playcount = 0
+        
+        async with async_read_session() as session:
+            if (db_most_played := await session.get(DBMapPlaycount, (user.id, server.server_name, play.beatmap_id))):
+                total_playcount = db_most_played.play_count
+            # No lazy loads on async sessions, bring the beatmapset along for get_title
+            beatmap = await session.get(DBBeatmap, play.beatmap_id, options=[joinedload(DBBeatmap.beatmapset)])
+            if not beatmap or not beatmap.beatmapset:
+                return None, total_playcount
+            session.expunge(beatmap.beatmapset)
+            session.expunge(beatmap)
+
+        return beatmap, total_playcount
         
     async def run(self, message: Message, args: List[str]):
         user = None
@@ -31,7 +49,7 @@ class RecentCommand(Command):
                     return
             else:
                 user = arg
-        link = self._get_link(message)
+        link = await run_blocking(self._get_link, message)
         if not server:
             if not link:
                 await self._msg_not_linked(message)
@@ -41,12 +59,12 @@ class RecentCommand(Command):
             if not link:
                 await self._msg_not_linked(message)
                 return
-            user = server.get_user_info(link.links[server.server_name])[0]
+            user = (await run_blocking(server.get_user_info, link.links[server.server_name]))[0]
             if not user:
                 await message.reply(f"User not found on {server.server_name}!")
                 return
         else:
-            user = server.get_user_info(user)[0]
+            user = (await run_blocking(server.get_user_info, user))[0]
             if not user:
                 await message.reply(f"User not found on {server.server_name}!")
                 return
@@ -57,18 +75,13 @@ class RecentCommand(Command):
             else:
                 mode = 0
                 relax = 0
-        recent_plays = server.get_user_recent(user.id, mode, relax)
+        recent_plays = await run_blocking(server.get_user_recent, user.id, mode, relax)
         
         if not recent_plays:
             await message.reply(f"No recent plays found for {user.username} on {server.server_name}.")
             return
         
         retries = 0
-        total_playcount = 0
-        
-        with app.database.managed_session() as session:
-            if (db_most_played := session.get(DBMapPlaycount, (user.id, server.server_name, recent_plays[0].beatmap_id))):
-                total_playcount = db_most_played.play_count
 
         for play in recent_plays:
             if play.beatmap_id != recent_plays[0].beatmap_id:
@@ -77,21 +90,19 @@ class RecentCommand(Command):
         
         play = recent_plays[0]
         
-        with app.database.managed_session() as session:
-            beatmap = session.get(DBBeatmap, play.beatmap_id)
-            if not beatmap or not beatmap.beatmapset:
-                await message.reply(f"Beatmap not found???")
-                return
-            session.expunge(beatmap.beatmapset)
+        beatmap, total_playcount = await self._load_play_details(server, user, play)
+        if not beatmap:
+            await message.reply(f"Beatmap not found???")
+            return
 
-        pp_system = by_version(server.get_pp_system(mode, relax))
-        if pp_system:
-            fc_pp = pp_system.calculate_score(recent_plays[0], as_fc=True)
-            ss_pp = pp_system.simulate(SimulatedScore(beatmap.id, mode, mods=play.mods))
+        pp_version = server.get_pp_system(mode, relax)
+        if by_version(pp_version):
+            fc_pp, = await pp_engine.calculate_fc([(pp_version, play)])
+            ss_pp, = await pp_engine.simulate([(pp_version, beatmap.id, mode, play.mods)])
         else:
             fc_pp = 0
             ss_pp = 0
-            
+
         status = beatmap.status[server.server_name] if server.server_name in beatmap.status else -2
 
         completion = ""
@@ -1,18 +1,32 @@
 from common.database.objects import DBServerPreferences
 from discord import Message
+from bot.discord.cache import prefixes
 from typing import List
 from . import Command
 
-import common.app as app
+import bot.discord.async_database as async_database
+
 class SetPrefixCommand(Command):
     
     def __init__(self) -> None:
         super().__init__("setprefix", "Set bot prefix")
+
+    async def _save_prefix(self, guild_id: int, prefix: str):
+        async with async_database.managed_session() as session:
+            if (guild := await session.get(DBServerPreferences, guild_id)):
+                guild.prefix = prefix
+            else:
+                session.add(DBServerPreferences(guild_id=guild_id, prefix=prefix))
+            await session.commit()
+        prefixes.set(guild_id, prefix)
         
     async def run(self, message: Message, args: List[str]):
         if not args:
             await message.reply("Usage: !setprefix <prefix>")
             return
+        if not message.guild:
+            await message.reply("This command can only be used in a server!")
+            return
         has_role = False
         for role in message.author.roles:
             if role.permissions.administrator or role.permissions.manage_guild:
@@ -21,11 +35,5 @@ class SetPrefixCommand(Command):
         if not has_role:
             await message.reply("You don't have permission to use this command!")
             return
-        with app.database.managed_session() as session:
-            if (guild := session.get(DBServerPreferences, message.guild.id)):
-                guild.prefix = args[0]
-                session.commit()
-            else:
-                session.add(DBServerPreferences(guild_id=message.guild.id, prefix=args[0]))
-                session.commit()
+        await self._save_prefix(message.guild.id, args[0])
         await message.reply(f"Set prefix to {args[0]}.")
\ No newline at end of file
@@ -1,18 +1,30 @@
 import discord
-from common.database.objects import DBFirstPlace, DBStatsTemp, DBStats, DBUser, DBScore
+from common.database.objects import DBBeatmap, DBFirstPlace, DBStatsTemp, DBStats, DBScore
 from common.api.server_api import User, Stats, ServerAPI
-from common.app import database
 from . import Command
 
 from datetime import datetime, timedelta
 from discord.ui import View, button
+from sqlalchemy.orm import Query, Session, contains_eager, joinedload
+from sqlalchemy import select
 from common.constants import Mods
 from discord import Color, Colour, Embed, Message
-from typing import List
+from bot.discord.dispatch import run_blocking
+from bot.discord.pagination import KeysetPager
+from bot.discord.read_routing import read_session, async_read_session
+from bot.discord.cache import TTLCache
+from bot.discord.stats_writer import stats_writer, STATS_TEMP_LIFETIME
+from typing import Any, Callable, List, NamedTuple, Tuple
 from common.repos import beatmaps
-import common.servers as servers
+import bot.discord.async_database as async_database
+import bot.discord.pp_engine as pp_engine
+import functools
+import asyncio
 import random
-from common.performance import by_version, SimulatedScore
+from common.performance import by_version
+
+# Clear counts only change when new scores are tracked, no need to count on every !showclears
+counts = TTLCache(ttl=60, maxsize=4096)
 
 def format_level(level: float) -> str:
     return f"{level:.0f} +{(level - int(level))*100:.1f}%"
@@ -23,170 +35,201 @@ def format_playtime(playtime: int) -> str:
     else:
         return f"{playtime // 60}m {playtime % 60}s"
 
+VARIABLE_NAMES = {
+    'ranked_score': 'Ranked Score',
+    'total_score': 'Total Score',
+    'play_count': 'Play Count',
+    'play_time': 'Play Time',
+    'replays_watched': 'Replays Views',
+    'accuracy': 'Accuracy',
+    'total_hits': 'Total Hits',
+    'max_combo': 'Max Combo',
+    'level': 'Level',
+    'pp': 'Performance',
+    'first_places': 'First Places',
+    'global_rank': 'Global Rank',
+    'country_rank': 'Country Rank',
+    'global_score_rank': 'Global Score Rank',
+    'country_score_rank': 'Country Score Rank',
+    'xh_rank': 'SS+',
+    'x_rank': 'SS',
+    'sh_rank': 'S+',
+    's_rank': 'S',
+    'a_rank': 'A',
+    'b_rank': 'B',
+    'c_rank': 'C',
+    'd_rank': 'D',
+    'clears': 'Clears',
+    'followers': 'Followers',
+    'medals_unlocked': 'Medals Unlocked',
+}
+
+CUSTOM_FORMATTING = {
+    'level': format_level,
+    'play_time': format_playtime
+}
+
+# Default formatting, format is field_name|formatting|use reverse gain (boolean)/....
+DEFAULT_LAYOUT = "ranked_score|{:,}/total_score|{:,}/total_hits|{:,}/play_count|{:,}/play_time|play_time/replays_watched|{:,}/level|level/accuracy|{:.2f}%/max_combo|{:,}x/global_rank|#{:.0f}/country_rank|#{:.0f}/pp|{:.0f}pp"
+
+def _is_numeric(column) -> bool:
+    try:
+        return issubclass(column.type.python_type, (int, float)) and not column.primary_key
+    except NotImplementedError:
+        return False
+
+# Everything a layout may show
+STATS_FIELDS = set(VARIABLE_NAMES) | {column.name for column in DBStats.__table__.columns if _is_numeric(column)}
+
+class LayoutField(NamedTuple):
+    name: str
+    label: str
+    format: Callable[[float], str]
+    reverse: bool
+
+@functools.lru_cache(maxsize=256)
+def compile_layout(layout: str) -> Tuple[LayoutField, ...]:
+    fields = list()
+    for field in layout.split("/"):
+        field = field.split("|")
+        name = field[0]
+        formatting = field[1] if len(field) > 1 else "{:.2f}"
+        reverse = bool(field[2]) if len(field) > 2 else False
+        if name not in STATS_FIELDS:
+            raise ValueError(f"Unknown field: {name}")
+        if formatting in CUSTOM_FORMATTING:
+            format = CUSTOM_FORMATTING[formatting]
+        else:
+            try: # Check the format string works for both ints and floats now, not at every render
+                formatting.format(1)
+                formatting.format(1.5)
+            except (ValueError, IndexError, KeyError, AttributeError) as e:
+                raise ValueError(f"Invalid formatting for {name}: {formatting}") from e
+            format = formatting.format
+        # Any numeric stats column works, the known ones just get a nicer label
+        fields.append(LayoutField(name, VARIABLE_NAMES.get(name, name), format, reverse))
+    return tuple(fields)
+
 class ShowCommand(Command):
     
-    variable_names = {
-        'ranked_score': 'Ranked Score',
-        'total_score': 'Total Score',
-        'play_count': 'Play Count',
-        'play_time': 'Play Time',
-        'replays_watched': 'Replays Views',
-        'accuracy': 'Accuracy',
-        'total_hits': 'Total Hits',
-        'max_combo': 'Max Combo',
-        'level': 'Level',
-        'pp': 'Performance',
-        'first_places': 'First Places',
-        'global_rank': 'Global Rank',
-        'country_rank': 'Country Rank',
-        'global_score_rank': 'Global Score Rank',
-        'country_score_rank': 'Country Score Rank',
-        'xh_rank': 'SS+',
-        'x_rank': 'SS',
-        'sh_rank': 'S+',
-        's_rank': 'S',
-        'a_rank': 'A',
-        'b_rank': 'B',
-        'c_rank': 'C',
-        'd_rank': 'D',
-        'clears': 'Clears',
-        'followers': 'Followers',
-        'medals_unlocked': 'Medals Unlocked',
-    }
-    
-    custom_formatting = {
-        'level': format_level,
-        'play_time': format_playtime
-    }
-    
     def __init__(self) -> None:
-        super().__init__("show", "show info about a player")
+        super().__init__("show", "show info about a player", "Use -formatting <layout or saved layout name> to change displayed stats, see !layout to save layouts.")
 
     def get_embed(self, server: ServerAPI, user: User, stats: Stats, old_stats: Stats, layout: str) -> Embed:
         embed = Embed(title=f"Stats for {user.username}")
         embed.set_thumbnail(url=f"{server.get_user_pfp(user.id)}?cachemakesmesad={random.randint(0, 9**9)}")
         embed.color = Colour(user.id if user.id < 16777215 else int(user.id / 9**3))
         
-        fields = [x.split("|") for x in layout.split("/")]
-        
-        for field in fields:
-            name = field[0]
-            formatting = "{:.2f}"
-            reverse = False
-        
-            if len(field) > 1:
-                formatting = field[1]
-                if len(field) > 2:
-                    reverse = bool(field[2])
-        
-            def format(value: float) -> str:
-                if formatting in self.custom_formatting:
-                    return self.custom_formatting[formatting](value)
-                else:
-                    return formatting.format(value)
-
-            if name in stats.__dict__:
-                attr = getattr(stats, name)
-                value = format(attr) if attr is not None else "N/A"
-                suffix = ""
-                if old_stats and name in old_stats.__dict__ and old_stats.__dict__[name]:
-                    difference = getattr(stats, name) - getattr(old_stats, name)
-                    if reverse:
-                        difference = -difference
-                    if difference: # Stats have changed thus showing gain/loss
-                        suffix = f" ({format(difference)})" if difference < 0 else f" (+{format(difference)})"
-                embed.add_field(name=self.variable_names[name] if name in self.variable_names else name, value=value+suffix, inline=True)
+        for field in compile_layout(layout):
+            attr = getattr(stats, field.name, None)
+            value = field.format(attr) if attr is not None else "N/A"
+            suffix = ""
+            if old_stats and (old_value := getattr(old_stats, field.name, None)) and attr is not None:
+                difference = attr - old_value
+                if field.reverse:
+                    difference = -difference
+                if difference: # Stats have changed thus showing gain/loss
+                    suffix = f" ({field.format(difference)})" if difference < 0 else f" (+{field.format(difference)})"
+            embed.add_field(name=field.label, value=value+suffix, inline=True)
         
         return embed
 
+    def _get_layout(self, link, formatting: str | None) -> str:
+        layouts = link.preferences.get('layouts', {}) if link and link.preferences else {}
+        if formatting:
+            return layouts.get(formatting, formatting)
+        if link and link.preferences and (default := link.preferences.get('layout')) in layouts:
+            return layouts[default]
+        return DEFAULT_LAYOUT
+
+    async def _get_old_stats(self, discord_id: int, server: ServerAPI, user: User, mode: int, relax: int, to_compare) -> DBStats | DBStatsTemp | None:
+        if to_compare: # Get stats from db if a date is specified, past days never change so the replica can serve them
+            async with async_read_session() as session:
+                if (old_stats := await session.get(DBStats, (server.server_name, user.id, mode, relax, to_compare))):
+                    session.expunge(old_stats)
+                return old_stats
+        async with async_database.managed_session() as session:
+            # Find oldest stats that isnt expired, expired ones are cleaned up by the stats writer
+            old_stats = (await session.execute(select(DBStatsTemp).where(
+                DBStatsTemp.server == server.server_name,
+                DBStatsTemp.user_id == user.id,
+                DBStatsTemp.mode == mode,
+                DBStatsTemp.relax == relax,
+                DBStatsTemp.discord_id == discord_id,
+                DBStatsTemp.date > datetime.now() - STATS_TEMP_LIFETIME
+            ).order_by(DBStatsTemp.date.asc()).limit(1))).scalars().first()
+            if old_stats:
+                session.expunge(old_stats)
+            return old_stats
+
     async def run(self, message: Message, args: List[str]):
         parsed = self._parse_args(args)
-        server = None
-        username = 0
-        mode = 0
-        relax = 0
-        # Default formatting, format is field_name|formatting|use reverse gain (boolean)/....
-        # TODO: Get formatting from user's config
-        formatting = "ranked_score|{:,}/total_score|{:,}/total_hits|{:,}/play_count|{:,}/play_time|play_time/replays_watched|{:,}/level|level/accuracy|{:.2f}%/max_combo|{:,}x/global_rank|#{:.0f}/country_rank|#{:.0f}/pp|{:.0f}pp"
+        formatting = None
         to_compare = None
 
         if 'compare_to' in parsed:
             to_compare = datetime.strptime(parsed['compare_to'], '%d/%m/%Y').date()
         if 'formatting' in parsed:
             formatting = parsed['formatting']
-        if parsed['default']:
-            username = parsed['default'][0]
-
-        if 'server' in parsed:
-            server = servers.by_name(parsed['server'])
-            if not server:
-                await message.reply(f"Unknown server! Use !servers to see available servers.")
-                return
 
-        if 'mode' in parsed:
-            mode = parsed['mode'][0]
-            relax = parsed['mode'][1]
-
-        link = self._get_link(message)
-        if link:
-            if not server:
-                server = servers.by_name(link.default_server)
-            if not username:
-                username = link.links[server.server_name]
-            if not 'mode' in parsed:
-                mode = link.default_mode
-                relax = link.default_relax
-        elif not username:
-            await self._msg_not_linked(message)
+        if not (context := await self._resolve_context(message, parsed)):
             return
-        
-        if not server:
-            server = servers.by_name("akatsuki")
+        server, user, stats, mode, relax, link = context.server, context.user, context.stats, context.mode, context.relax, context.link
 
-        user, stats = server.get_user_info(username, mode, relax)
-        if not user:
-            await message.reply(f"User not found on {server.server_name}!")
+        layout = self._get_layout(link, formatting)
+        try:
+            compile_layout(layout)
+        except ValueError as e:
+            await message.reply(f"Invalid layout! {e}")
             return
 
         if not server.supports_rx: # Fixes nasty side effect of saving stats as rx
             relax = 0
 
         stats = stats[0].to_db()
-        old_stats = None
-
-        with database.managed_session() as session:
-            for stat in session.query(DBStatsTemp).filter(
-                DBStatsTemp.server == server.server_name,
-                DBStatsTemp.user_id == user.id,
-                DBStatsTemp.mode == mode,
-                DBStatsTemp.relax == relax,
-                DBStatsTemp.discord_id == message.author.id
-            ).order_by(DBStatsTemp.date.asc()): # Find oldest stats that isnt expired
-                if (datetime.now() - stat.date) > timedelta(days=1):
-                    session.delete(stat)
-                elif not old_stats:
-                    old_stats = stat
-                    session.expunge(stat)
-            
-            if old_stats: # Save stats if more than 10 minutes elapsed
-                if (datetime.now() - old_stats.date) > timedelta(minutes=10):
-                    session.merge(stats.copy(message.author.id))
-            else:
-                session.merge(stats.copy(message.author.id))
-
-            if to_compare: # Get stats from db if a date is specified
-                old_stats = session.get(DBStats, (server.server_name, user.id, mode, relax, to_compare))
-                if not old_stats:
-                    await message.reply(f"We don't have stats stored for that day...")
-                    return
-                session.expunge(old_stats)
-            session.commit()
+        temp_stats = await self._get_old_stats(message.author.id, server, user, mode, relax, None)
+        # Save stats if more than 10 minutes elapsed
+        if not temp_stats or (datetime.now() - temp_stats.date) > timedelta(minutes=10):
+            stats_writer.add(stats.copy(message.author.id))
+
+        old_stats = temp_stats
+        if to_compare:
+            old_stats = await self._get_old_stats(message.author.id, server, user, mode, relax, to_compare)
+            if not old_stats:
+                await message.reply(f"We don't have stats stored for that day...")
+                return
 
-        await message.reply(embed=self.get_embed(server, user, stats, old_stats, formatting))
+        await message.reply(embed=self.get_embed(server, user, stats, old_stats, layout))
+
+def clears_query(session: Session, user_id: int, server: str, mode: int, relax: int) -> Query:
+    return session.query(DBScore).filter(
+        DBScore.user_id == user_id,
+        DBScore.mode == mode,
+        DBScore.relax == relax,
+        DBScore.server == server
+    )
+
+def first_places_query(session: Session, user_id: int, server: str, mode: int, relax: int) -> Query:
+    return session.query(DBFirstPlace).filter(
+        DBFirstPlace.user_id == user_id,
+        DBFirstPlace.mode == mode,
+        DBFirstPlace.relax == relax,
+        DBFirstPlace.server == server,
+    )
+
+async def simulate_scores(scores: List[DBScore]) -> List[Tuple[float, float]]:
+    # fc and ss pp for a page of scores, calculated in the process pool
+    supported = [score for score in scores if by_version(score.pp_system)]
+    fc_pps = await pp_engine.calculate_db_fc([(score.pp_system, pp_engine.db_score_values(score)) for score in supported])
+    ss_pps = await pp_engine.simulate([(score.pp_system, score.beatmap_id, score.mode, score.mods) for score in supported])
+    pps = {id(score): (fc_pp or score.pp, ss_pp) for score, fc_pp, ss_pp in zip(supported, fc_pps, ss_pps)}
+    return [pps.get(id(score), (0, 0)) for score in scores]
 
 class TopView(View):
     
-    def __init__(self, user: DBUser, mode: int, relax: int, query):
+    # Views live for minutes, so they only keep what is needed to rebuild the query,
+    # every render runs on its own short-lived session
+    def __init__(self, user_id: int, username: str, server: str, mode: int, relax: int, count: int):
         super().__init__()
         self.sort_methods = [
             ("pp", "PP"),
@@ -195,38 +238,52 @@ class TopView(View):
             ("score", "Score"),
             ("max_combo", "Max Combo"),
         ]
-        self.user = user
+        self.user_id = user_id
+        self.username = username
+        self.server = server
         self.length = 5
-        self.count = query.count()
-        self.page = 0
+        self.count = count
         self.sort = 0
         self.desc = True
         self.mode = mode
         self.relax = relax
-        self.query = query
-        self.actual_query = self.query.order_by(getattr(DBScore, self.sort_methods[self.sort][0]).desc())  
+        self.pager = KeysetPager(self.get_query, count, self.length, self.sort_methods[self.sort][0], self.desc)
+        # The pager moves its keys while fetching on a worker thread, clicks have to take turns
+        self.lock = asyncio.Lock()
+
+    def get_query(self, session: Session) -> Query:
+        return clears_query(session, self.user_id, self.server, self.mode, self.relax).options(joinedload(DBScore.beatmap).joinedload(DBBeatmap.beatmapset))
+
+    def _fetch(self, fetch: Callable[[Session], Any]) -> List[Any]:
+        with read_session() as session:
+            return fetch(session)
+
+    async def _render(self, fetch: Callable[[Session], Any]) -> Embed:
+        rows = await run_blocking(self._fetch, fetch)
+        return await run_blocking(self.get_embed, rows, await simulate_scores(rows))
+
+    async def update(self, interaction: discord.Interaction, fetch):
+        async with self.lock:
+            embed = await self._render(fetch)
+        await interaction.response.edit_message(embed=embed, view=self)
       
     @button(label="Previous", style=discord.ButtonStyle.secondary)
     async def prev(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.page > 0:
-            self.page -= 1
-            await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        if self.pager.page > 0:
+            await self.update(interaction, self.pager.prev)
     
     @button(label="Next", style=discord.ButtonStyle.secondary)
     async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.page < self.count/self.length-1:
-            self.page += 1
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        await self.update(interaction, self.pager.next)
     
     @button(label="Last", style=discord.ButtonStyle.secondary)
     async def last(self, interaction: discord.Interaction, button: discord.ui.Button):
         if button.label == "Last":
-            self.page = int(self.count/self.length)
             button.label = "First"
+            await self.update(interaction, self.pager.last)
         else:
-            self.page = 0
             button.label = "Last"
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+            await self.update(interaction, self.pager.first)
     
     @button(label="PP", style=discord.ButtonStyle.secondary)
     async def sort(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -234,46 +291,26 @@ class TopView(View):
         if self.sort >= len(self.sort_methods):
             self.sort = 0
         button.label = self.sort_methods[self.sort][1]
-        if self.desc: # lazy
-            self.actual_query = self.query.order_by(getattr(DBScore, self.sort_methods[self.sort][0]).desc())
-        else:
-            self.actual_query = self.query.order_by(getattr(DBScore, self.sort_methods[self.sort][0]).asc())
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        await self.update(interaction, lambda session: self.pager.sort_by(session, self.sort_methods[self.sort][0], self.desc))
     
     @button(label="↓", style=discord.ButtonStyle.secondary)
     async def sort_direction(self, interaction: discord.Interaction, button: discord.ui.Button):
         if button.label == "↓":
             button.label = "↑"
             self.desc = False
-            self.actual_query = self.query.order_by(getattr(DBScore, self.sort_methods[self.sort][0]).asc())
         else:
             button.label = "↓"
             self.desc = True
-            self.actual_query = self.query.order_by(getattr(DBScore, self.sort_methods[self.sort][0]).desc())
-        self.page = 0
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
-
-    def simulate_pp(self, score: DBScore):
-        pp_system = by_version(score.pp_system)
-        if pp_system:
-            fc_pp = pp_system.calculate_db_score(score, as_fc=True)
-            ss_pp = pp_system.simulate(SimulatedScore(score.beatmap_id, score.mode, mods=score.mods))
-            if not fc_pp:
-                fc_pp = score.pp
-        else:
-            fc_pp = 0
-            ss_pp = 0
-        return fc_pp, ss_pp
+        await self.update(interaction, lambda session: self.pager.sort_by(session, self.sort_methods[self.sort][0], self.desc))
 
-    def get_embed(self) -> Embed:
+    def get_embed(self, rows: List[Any], pps: List[Tuple[float, float]]) -> Embed:
         embed = Embed(color=discord.Color.blue())
-        embed.title = f"{self.user.username}'s clears ({self.count}, page {self.page+1}/{int(self.count/self.length)+1})"
+        embed.title = f"{self.username}'s clears ({self.count}, page {self.pager.page+1}/{self.pager.last_page+1})"
         embed.description = ""
-        i = self.page*self.length
-        for score in self.actual_query.offset(self.page*self.length).limit(self.length):
+        i = self.pager.page*self.length
+        for score, (fc_pp, ss_pp) in zip(rows, pps):
             i+=1
             score: DBScore = score
-            fc_pp, ss_pp = self.simulate_pp(score)
             embed.description += f"{i}. **[{score.beatmap.get_title()}](https://osu.ppy.sh/b/{score.beatmap_id}) +{Mods(score.mods).short}**\n"
             embed.description += f"**PP**:    {score.pp:.0f}/{fc_pp:.0f} (SS: {ss_pp:.0f})\n"
             embed.description += f"**Stats**: __{score.count_300}/{score.count_100}/{score.count_50}/{score.count_miss}__ **{score.accuracy:.2f}%** __{score.max_combo}x/{score.beatmap.max_combo}x__ **{score.rank}** __{score.score:,}__\n"
@@ -281,72 +318,45 @@ class TopView(View):
         return embed
 
     async def reply(self, message: Message):
-        await message.reply(embed=self.get_embed(), view=self)
+        async with self.lock:
+            embed = await self._render(self.pager.first)
+        await message.reply(embed=embed, view=self)
 
 class ShowClearsCommand(Command):
     
     def __init__(self) -> None:
         super().__init__("showclears", "Show clears")
+
+    def _count(self, user_id: int, server: str, mode: int, relax: int) -> int:
+        with read_session() as session:
+            return clears_query(session, user_id, server, mode, relax).count()
         
     async def run(self, message: Message, args: List[str]):
         parsed = self._parse_args(args)
-        server = None
-        username = 0
-        mode = 0
-        relax = 0
-
-        if parsed['default']:
-            username = parsed['default'][0]
-
-        if 'server' in parsed:
-            server = servers.by_name(parsed['server'])
-            if not server:
-                await message.reply(f"Unknown server! Use !servers to see available servers.")
-                return
-
-        if 'mode' in parsed:
-            mode = parsed['mode'][0]
-            relax = parsed['mode'][1]
-
-        link = self._get_link(message)
-        if link:
-            if not server:
-                server = servers.by_name(link.default_server)
-            if not username:
-                username = link.links[server.server_name]
-            if not 'mode' in parsed:
-                mode = link.default_mode
-                relax = link.default_relax
-        elif not username:
-            await self._msg_not_linked(message)
+        if not (context := await self._resolve_context(message, parsed)):
             return
+        server, user, mode, relax = context.server, context.user, context.mode, context.relax
 
-        if not server:
-            server = servers.by_name("akatsuki")
-
-        user, _ = server.get_user_info(username, mode, relax)
+        count_key = ('clears', server.server_name, user.id, mode, relax)
+        if (count := counts.get(count_key)) is None:
+            count = await run_blocking(self._count, user.id, server.server_name, mode, relax)
+            counts.set(count_key, count)
 
-        query = database.session.query(DBScore).filter(
-            DBScore.user_id == user.id,
-            DBScore.mode == mode,
-            DBScore.relax == relax,
-            DBScore.server == server.server_name
-        )
-        
-        if query.count() == 0:
+        if count == 0:
             await message.reply(f"User {user.username} has no clears on {server.server_name}!")
             return
         
-        await TopView(user, mode, relax, query).reply(message)
+        await TopView(user.id, user.username, server.server_name, mode, relax, count).reply(message)
 
 class FirstView(View):
     
-    def __init__(self, user: DBUser, mode: int, relax: int, query, latest_date: datetime, earlier_date: datetime):
+    def __init__(self, user_id: int, username: str, server: str, mode: int, relax: int, latest_date: datetime, earlier_date: datetime, count: int):
         super().__init__()
-        self.user = user
+        self.user_id = user_id
+        self.username = username
+        self.server = server
         self.mode = mode
         self.relax = relax
-        self.query = query
         self.sort_methods = [
             ("pp", "PP"),
             ("date", "Date"),
@@ -359,44 +369,46 @@ class FirstView(View):
         self.desc = True
         self.latest_date = latest_date
         self.earlier_date = earlier_date
-        self.sort_query(self.sort_methods[self.sort][0], self.desc, 0)
-        self.count = self.actual_query.count()
+        self.count = count
         self.length = 7
-        self.page = 0
-
-    def simulate_pp(self, score: DBScore):
-        pp_system = by_version(score.pp_system)
-        if pp_system:
-            fc_pp = pp_system.calculate_db_score(score, as_fc=True)
-            ss_pp = pp_system.simulate(SimulatedScore(score.beatmap_id, score.mode, mods=score.mods))
-            if not fc_pp:
-                fc_pp = score.pp
-        else:
-            fc_pp = 0
-            ss_pp = 0
-        return fc_pp, ss_pp
+        self.pager = KeysetPager(self.get_query, count, self.length, self.sort_methods[self.sort][0], self.desc, score_of=lambda first_place: first_place.score)
+        self.lock = asyncio.Lock()
+
+    def get_query(self, session: Session) -> Query:
+        query = first_places_query(session, self.user_id, self.server, self.mode, self.relax)
+        if self.type == 0:
+            return query.filter(DBFirstPlace.date == self.latest_date).join(DBScore).options(contains_eager(DBFirstPlace.score).joinedload(DBScore.beatmap).joinedload(DBBeatmap.beatmapset))
+
+    def _fetch(self, fetch: Callable[[Session], Any]) -> List[Any]:
+        with read_session() as session:
+            return fetch(session)
+
+    async def _render(self, fetch: Callable[[Session], Any]) -> Embed:
+        rows = await run_blocking(self._fetch, fetch)
+        return await run_blocking(self.get_embed, rows, await simulate_scores([row.score for row in rows]))
+
+    async def update(self, interaction: discord.Interaction, fetch):
+        async with self.lock:
+            embed = await self._render(fetch)
+        await interaction.response.edit_message(embed=embed, view=self)
 
     @button(label="Previous", style=discord.ButtonStyle.secondary)
     async def prev(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.page > 0:
-            self.page -= 1
-            await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        if self.pager.page > 0:
+            await self.update(interaction, self.pager.prev)
     
     @button(label="Next", style=discord.ButtonStyle.secondary)
     async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.page < self.count/self.length-1:
-            self.page += 1
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        await self.update(interaction, self.pager.next)
     
     @button(label="Last", style=discord.ButtonStyle.secondary)
     async def last(self, interaction: discord.Interaction, button: discord.ui.Button):
         if button.label == "Last":
-            self.page = int(self.count/self.length)
             button.label = "First"
+            await self.update(interaction, self.pager.last)
         else:
-            self.page = 0
             button.label = "Last"
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+            await self.update(interaction, self.pager.first)
     
     @button(label="PP", style=discord.ButtonStyle.secondary)
     async def sort_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -404,36 +416,26 @@ class FirstView(View):
         if self.sort >= len(self.sort_methods):
             self.sort = 0
         button.label = self.sort_methods[self.sort][1]
-        self.sort_query(self.sort_methods[self.sort][0], self.desc, self.type)
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        await self.update(interaction, lambda session: self.pager.sort_by(session, self.sort_methods[self.sort][0], self.desc))
     
     @button(label="↓", style=discord.ButtonStyle.secondary)
     async def sort_direction(self, interaction: discord.Interaction, button: discord.ui.Button):
         if button.label == "↓":
             button.label = "↑"
             self.desc = False
-            self.sort_query(self.sort_methods[self.sort][0], self.desc, self.type)
         else:
             button.label = "↓"
             self.desc = True
-            self.sort_query(self.sort_methods[self.sort][0], self.desc, self.type)
-        self.page = 0
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        await self.update(interaction, lambda session: self.pager.sort_by(session, self.sort_methods[self.sort][0], self.desc))
 
-    def sort_query(self, column_name, desc, query_type):
-        if query_type == 0:
-            self.actual_query = self.query.filter(DBFirstPlace.date == self.latest_date).join(DBScore).order_by(getattr(DBScore, column_name).desc() if desc else getattr(DBScore, column_name).asc())
-            self.page = 0
-
-    def get_embed(self) -> Embed:
+    def get_embed(self, rows: List[Any], pps: List[Tuple[float, float]]) -> Embed:
         embed = Embed(color=discord.Color.blue())
-        embed.title = f"{self.user.username}'s clears ({self.count}, page {self.page+1}/{int(self.count/self.length)+1})"
+        embed.title = f"{self.username}'s clears ({self.count}, page {self.pager.page+1}/{self.pager.last_page+1})"
         embed.description = ""
-        i = self.page*self.length
-        for score in self.actual_query.offset(self.page*self.length).limit(self.length):
+        i = self.pager.page*self.length
+        for score, (fc_pp, ss_pp) in zip(rows, pps):
             i+=1
             score: DBScore = score.score
-            fc_pp, ss_pp = self.simulate_pp(score)
             embed.description += f"{i}. **[{score.beatmap.get_title()}](https://osu.ppy.sh/b/{score.beatmap_id}) +{Mods(score.mods).short}**\n"
             embed.description += f"**PP**:    {score.pp:.0f}/{fc_pp:.0f} (SS: {ss_pp:.0f})\n"
             embed.description += f"**Stats**: __{score.count_300}/{score.count_100}/{score.count_50}/{score.count_miss}__ **{score.accuracy:.2f}%** __{score.max_combo}x/{score.beatmap.max_combo}x__ **{score.rank}** __{score.score:,}__\n"
@@ -441,65 +443,26 @@ class FirstView(View):
         return embed
 
     async def reply(self, message: Message):
-        await message.reply(embed=self.get_embed(), view=self)
+        async with self.lock:
+            embed = await self._render(self.pager.first)
+        await message.reply(embed=embed, view=self)
 
 
 class Show1sCommand(Command):
     
     def __init__(self) -> None:
         super().__init__("show1s", "Show first places")
-        
-    async def run(self, message: Message, args: List[str]):
-        parsed = self._parse_args(args)
-        server = None
-        username = 0
-        mode = 0
-        relax = 0
-
-        if parsed['default']:
-            username = parsed['default'][0]
-
-        if 'server' in parsed:
-            server = servers.by_name(parsed['server'])
-            if not server:
-                await message.reply(f"Unknown server! Use !servers to see available servers.")
-                return
 
-        if 'mode' in parsed:
-            mode = parsed['mode'][0]
-            relax = parsed['mode'][1]
-
-        link = self._get_link(message)
-        if link:
-            if not server:
-                server = servers.by_name(link.default_server)
-            if not username:
-                username = link.links[server.server_name]
-            if not 'mode' in parsed:
-                mode = link.default_mode
-                relax = link.default_relax
-        elif not username:
-            await self._msg_not_linked(message)
-            return
-
-        if not server:
-            server = servers.by_name("akatsuki")
-
-        user, _ = server.get_user_info(username, mode, relax)
-
-        query = database.session.query(DBFirstPlace).filter(
-            DBFirstPlace.user_id == user.id,
-            DBFirstPlace.mode == mode,
-            DBFirstPlace.relax == relax,
-            DBFirstPlace.server == server.server_name,
-        )
+    def _get_dates(self, user_id: int, server: str, mode: int, relax: int) -> Tuple[datetime | None, datetime | None, int]:
+        with read_session() as session:
+            return self._get_dates_in(first_places_query(session, user_id, server, mode, relax))
 
+    def _get_dates_in(self, query) -> Tuple[datetime | None, datetime | None, int]:
         latest_date = query.order_by(DBFirstPlace.date.desc()).first()
         earlier_date = None
         
         if not latest_date:
-            await message.reply(f"User {user.username} has no recorded first places on {server.server_name}!")
-            return
+            return None, None, 0
         
         latest_date = latest_date.date
         
@@ -508,8 +471,21 @@ class Show1sCommand(Command):
         if len(subquery) == 2:
             earlier_date = subquery[1].date
         
-        if query.filter(DBFirstPlace.date == latest_date).count() == 0:
+        if (count := query.filter(DBFirstPlace.date == latest_date).count()) == 0:
+            return None, None, 0
+        
+        return latest_date, earlier_date, count
+        
+    async def run(self, message: Message, args: List[str]):
+        parsed = self._parse_args(args)
+        if not (context := await self._resolve_context(message, parsed)):
+            return
+        server, user, mode, relax = context.server, context.user, context.mode, context.relax
+
+        latest_date, earlier_date, count = await run_blocking(self._get_dates, user.id, server.server_name, mode, relax)
+        
+        if not latest_date:
             await message.reply(f"User {user.username} has no recorded first places on {server.server_name}!")
             return
         
-        await FirstView(user, mode, relax, query, latest_date, earlier_date).reply(message)
+        await FirstView(user.id, user.username, server.server_name, mode, relax, latest_date, earlier_date, count).reply(message)
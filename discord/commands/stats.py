@@ -0,0 +1,62 @@
+from discord import Message, Embed
+from typing import List
+from . import PermissionLevelEnum, Command
+
+from bot.discord.scheduler import scheduler
+from bot.discord.dispatch import loop_lag
+from bot.discord.pp_cache import pp_cache
+
+import bot.discord.metrics as metrics
+
+FIELD_LIMIT = 1024
+FIELD_COUNT_LIMIT = 25
+
+class StatsCommand(Command):
+
+    def __init__(self):
+        super().__init__("stats", "Shows bot performance metrics.", permission_level=PermissionLevelEnum.ADMIN)
+
+    def _format_seconds(self, seconds: float | None) -> str:
+        if seconds is None:
+            return "-"
+        if seconds == float("inf"):
+            return f">{metrics.DEFAULT_BUCKETS[-1]}s"
+        return f"{seconds*1000:.0f}ms" if seconds < 1 else f"{seconds:.1f}s"
+
+    def _add_lines(self, embed: Embed, name: str, lines: List[str]):
+        # Discord caps a field at 1024 characters and an embed at 25 fields, long lists continue in more fields
+        values = list()
+        for line in lines:
+            line = line[:FIELD_LIMIT]
+            if values and len(values[-1]) + len(line) + 1 <= FIELD_LIMIT:
+                values[-1] += "\n" + line
+            else:
+                values.append(line)
+        for i, value in enumerate(values):
+            if len(embed.fields) >= FIELD_COUNT_LIMIT:
+                break
+            embed.add_field(name=name if i == 0 else f"{name} (cont.)", value=value, inline=False)
+
+    async def run(self, message: Message, args: List[str]):
+        embed = Embed(title="Bot stats")
+        embed.add_field(name="Event loop", value=f"Lag: {loop_lag.lag*1000:.0f}ms\nMax lag: {loop_lag.max_lag*1000:.0f}ms", inline=False)
+        embed.add_field(name="Scheduler", value=f"Running: {sum(scheduler.user_running.values())}\nDeduplicated: {scheduler.deduplicated}\nRejected: {scheduler.rejected}", inline=False)
+
+        commands = list()
+        for (command,) in sorted(metrics.command_seconds.series()):
+            count = metrics.command_seconds.count(command)
+            errors = int(metrics.command_errors.total(command=command))
+            p50 = self._format_seconds(metrics.command_seconds.quantile(0.5, command))
+            p99 = self._format_seconds(metrics.command_seconds.quantile(0.99, command))
+            commands.append(f"{command}: {count} runs, {errors} errors, p50 {p50}, p99 {p99}")
+        self._add_lines(embed, "Commands", commands or ["No commands run yet"])
+
+        caches = list()
+        for name, get_stats in metrics.caches.items():
+            hits, misses = get_stats()
+            rate = hits / (hits + misses) * 100 if hits + misses else 0
+            caches.append(f"{name}: {rate:.1f}% ({hits}/{hits + misses})")
+        stats = pp_cache.get_stats()
+        caches.append(f"pp time saved: {stats['time_saved']:.1f}s")
+        self._add_lines(embed, "Caches", caches)
+        await message.reply(embed=embed)
@@ -1,16 +1,36 @@
 from sqlalchemy.orm.attributes import flag_modified
 from common.database.objects import DBBotLink
-from common.app import database
 from discord import Message
+from bot.discord.dispatch import run_blocking
+from bot.discord.cache import links
 from typing import List
+from .show import compile_layout
 from . import Command
 
-import common.servers as servers
+import bot.discord.async_database as async_database
+import bot.discord.cached_servers as servers
 
 class LinkCommand(Command):
     
     def __init__(self):
         super().__init__("link", "Link account to bot")
+
+    async def _add_link(self, discord_id: int, server_name: str, user_id: int):
+        async with async_database.managed_session() as session:
+            if not (link := await session.get(DBBotLink, discord_id)):
+                link = DBBotLink(discord_id=discord_id)
+                link.default_server = server_name
+                link.default_mode = 0
+                link.default_relax = 0
+                link.permissions = 0
+                link.links = {}
+                link.preferences = {}
+                session.add(link)
+            link.links[server_name] = user_id
+            flag_modified(link, 'links')
+            flag_modified(link, 'preferences')
+            await session.commit()
+        links.invalidate(discord_id)
         
     async def run(self, message: Message, args: List[str]):
         if len(args) != 2:
@@ -24,26 +44,13 @@ class LinkCommand(Command):
             await message.reply(f"Unknown server: {server_name}! Use !servers to see available servers.")
             return
         
-        user, _ = server.get_user_info(username)
+        user, _ = await run_blocking(server.get_user_info, username)
         
         if not user:
             await message.reply(f"User {username} not found on {server.server_name}!")
             return
         
-        with database.managed_session() as session:
-            if not (link := session.get(DBBotLink, message.author.id)):
-                link = DBBotLink(discord_id=message.author.id)
-                link.default_server = server_name
-                link.default_mode = 0
-                link.default_relax = 0
-                link.permissions = 0
-                link.links = {}
-                link.preferences = {}
-                session.add(link)
-            link.links[server_name] = user.id
-            flag_modified(link, 'links')
-            flag_modified(link, 'preferences')
-            session.commit()
+        await self._add_link(message.author.id, server_name, user.id)
         
         await message.reply(f"Linked {user.username} ({user.id}) on {server_name}!")
 
@@ -56,7 +63,7 @@ class SetDefaultModeCommand(Command):
         if len(args) != 1:
             await message.reply("Usage: !defaultmode <mode>")
             return
-        if not (link := self._get_link(message)):
+        if not (link := await run_blocking(self._get_link, message)):
             await self._msg_not_linked(message)
             return        
         if not (mode := self._get_mode_from_string(args[0])):
@@ -65,9 +72,7 @@ class SetDefaultModeCommand(Command):
             return
         link.default_mode = mode[0]
         link.default_relax = mode[1]
-        with database.managed_session() as session:
-            session.merge(link)
-            session.commit()
+        await self._save_link(link)
         await message.reply(f"Set default mode to {args[0]}!")
 
 class SetDefaultServerCommand(Command):
@@ -79,7 +84,7 @@ class SetDefaultServerCommand(Command):
         if len(args) != 1:
             await message.reply("Usage: !defaultserver <server>")
             return
-        if not (link := self._get_link(message)):
+        if not (link := await run_blocking(self._get_link, message)):
             await self._msg_not_linked(message)
             return
         if not servers.by_name(args[0]):
@@ -89,7 +94,56 @@ class SetDefaultServerCommand(Command):
             await message.reply(f"You are not linked on {args[0]}!")
             return
         link.default_server = args[0]
-        with database.managed_session() as session:
-            session.merge(link)
-            session.commit()
-        await message.reply(f"Set default server to {args[0]}!")
\ No newline at end of file
+        await self._save_link(link)
+        await message.reply(f"Set default server to {args[0]}!")
+
+class LayoutCommand(Command):
+    
+    def __init__(self):
+        super().__init__("layout", "Manage saved !show layouts", "Usage: !layout save <name> <layout>, !layout default <name>, !layout delete <name>, !layout list\nLayout format is field_name|formatting|use reverse gain (boolean)/....")
+    
+    async def run(self, message: Message, args: List[str]):
+        if not args or args[0] not in ("save", "default", "delete", "list"):
+            await message.reply(self.help)
+            return
+        if not (link := await run_blocking(self._get_link, message)):
+            await self._msg_not_linked(message)
+            return
+        preferences = dict(link.preferences or {})
+        layouts = dict(preferences.get('layouts', {}))
+        if args[0] == "list":
+            if not layouts:
+                await message.reply("You don't have any saved layouts!")
+                return
+            content = "\n".join(f"{name}{' (default)' if name == preferences.get('layout') else ''}: {layout}" for name, layout in layouts.items())
+            await message.reply(f"```\n{content}```")
+            return
+        if args[0] == "save":
+            if len(args) != 3:
+                await message.reply(self.help)
+                return
+            try: # Reject broken layouts now instead of failing on every !show
+                compile_layout(args[2])
+            except ValueError as e:
+                await message.reply(f"Invalid layout! {e}")
+                return
+            layouts[args[1]] = args[2]
+            reply = f"Saved layout {args[1]}!"
+        elif len(args) != 2:
+            await message.reply(self.help)
+            return
+        elif args[1] not in layouts:
+            await message.reply(f"Unknown layout: {args[1]}!")
+            return
+        elif args[0] == "default":
+            preferences['layout'] = args[1]
+            reply = f"Set default layout to {args[1]}!"
+        else:
+            del layouts[args[1]]
+            if preferences.get('layout') == args[1]:
+                del preferences['layout']
+            reply = f"Deleted layout {args[1]}!"
+        preferences['layouts'] = layouts
+        link.preferences = preferences
+        await self._save_link(link)
+        await message.reply(reply)
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+from common.logging import get_logger
+from common.app import config
+from typing import Callable, TypeVar
+
+import contextvars
+import functools
+import asyncio
+
+T = TypeVar("T")
+
+logger = get_logger("discord_bot.dispatch")
+
+# Bounded pool for server API calls, database sessions and pp calculations
+executor = ThreadPoolExecutor(
+    max_workers=getattr(config, "discord_blocking_workers", 16),
+    thread_name_prefix="discord_blocking"
+)
+
+async def run_blocking(func: Callable[..., T], *args, **kwargs) -> T:
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context over so metrics know which command the work belongs to
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, func, *args, **kwargs))
+
+class LoopLagMonitor:
+
+    def __init__(self, interval: float = 0.5, warn_threshold: float = 0.25) -> None:
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - start - self.interval)
+            self.max_lag = max(self.max_lag, self.lag)
+            if self.lag > self.warn_threshold:
+                logger.warning(f"Event loop lagged by {self.lag*1000:.0f}ms")
+
+loop_lag = LoopLagMonitor()
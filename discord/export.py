@@ -0,0 +1,138 @@
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Iterable, Sequence
+
+import tempfile
+import datetime
+import gzip
+import json
+import csv
+import io
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXTENSIONS = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+    'none': '',
+}
+
+@dataclass
+class ExportResult:
+    file: BinaryIO
+    rows: int
+    raw_bytes: int
+    compressed_bytes: int
+    truncated: bool
+
+def _open_compressor(fileobj: BinaryIO, compression: str) -> BinaryIO:
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package!")
+        return zstandard.ZstdCompressor().stream_writer(fileobj, closefd=False)
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode="wb")
+    if compression == 'none':
+        return fileobj
+    raise ValueError(f"Unknown compression: {compression}")
+
+def write_delimited(header: Sequence[str], rows: Iterable[Sequence[Any]], delimiter: str = "\t", compression: str = "gzip", max_rows: int | None = None, chunk_size: int = 1000) -> ExportResult:
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    compressor = _open_compressor(spool, compression)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter, lineterminator="\n")
+    writer.writerow(header)
+    row_count = 0
+    raw_bytes = 0
+    truncated = False
+
+    def flush():
+        nonlocal raw_bytes
+        data = buffer.getvalue().encode()
+        compressor.write(data)
+        raw_bytes += len(data)
+        buffer.seek(0)
+        buffer.truncate()
+
+    for row in rows:
+        if max_rows is not None and row_count >= max_rows:
+            truncated = True
+            break
+        writer.writerow(row)
+        row_count += 1
+        if row_count % chunk_size == 0:
+            flush()
+    flush()
+
+    if compressor is not spool:
+        compressor.close()
+    compressed_bytes = spool.tell()
+    spool.seek(0)
+    return ExportResult(spool, row_count, raw_bytes, compressed_bytes, truncated)
+
+def _arrow_type(python_type: type | None):
+    return {
+        bool: pyarrow.bool_(),
+        int: pyarrow.int64(),
+        float: pyarrow.float64(),
+        str: pyarrow.string(),
+        datetime.datetime: pyarrow.timestamp("us"),
+        datetime.date: pyarrow.date32(),
+    }.get(python_type, pyarrow.string())
+
+def _arrow_value(value: Any, python_type: type | None) -> Any:
+    # Anything without a native arrow mapping (json columns mostly) is stored as text
+    if value is None or python_type in (bool, int, float, str, datetime.datetime, datetime.date):
+        return value
+    return json.dumps(value, default=str) if isinstance(value, (dict, list)) else str(value)
+
+def write_columnar(header: Sequence[str], types: Sequence[type | None], rows: Iterable[Sequence[Any]], format: str = "parquet", max_rows: int | None = None, chunk_size: int = 10000) -> ExportResult:
+    if pyarrow is None:
+        raise ValueError(f"{format} export requires the pyarrow package!")
+    schema = pyarrow.schema([(name, _arrow_type(python_type)) for name, python_type in zip(header, types)])
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    if format == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(spool, schema, compression="zstd")
+    elif format == "arrow":
+        writer = pyarrow.ipc.new_file(spool, schema, options=pyarrow.ipc.IpcWriteOptions(compression="zstd"))
+    else:
+        raise ValueError(f"Unknown format: {format}")
+    columns = [list() for _ in header]
+    row_count = 0
+    raw_bytes = 0
+    truncated = False
+
+    def flush():
+        nonlocal raw_bytes
+        if not columns[0]:
+            return
+        batch = pyarrow.record_batch([pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+        writer.write_batch(batch)
+        raw_bytes += batch.nbytes
+        for column in columns:
+            column.clear()
+
+    for row in rows:
+        if max_rows is not None and row_count >= max_rows:
+            truncated = True
+            break
+        for column, value, python_type in zip(columns, row, types):
+            column.append(_arrow_value(value, python_type))
+        row_count += 1
+        if row_count % chunk_size == 0:
+            flush()
+    flush()
+
+    writer.close()
+    compressed_bytes = spool.tell()
+    spool.seek(0)
+    return ExportResult(spool, row_count, raw_bytes, compressed_bytes, truncated)
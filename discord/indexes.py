@@ -0,0 +1,72 @@
+from common.database.objects import DBBeatmap, DBStatsTemp
+from common.logging import get_logger
+from common.app import database
+from sqlalchemy import Integer, cast, literal_column, text
+from typing import Dict, List
+
+import bot.discord.cached_servers as servers
+import re
+
+logger = get_logger("discord_bot.indexes")
+
+def _server_name(server: str) -> str:
+    # Only configured server names end up in the SQL, never what the user typed
+    if not (cached := servers.by_name(server)):
+        raise ValueError(f"Unknown server: {server}")
+    if not re.fullmatch(r"[A-Za-z0-9_]+", cached.server_name):
+        raise ValueError(f"Server name can't be used in an index: {cached.server_name}")
+    return cached.server_name
+
+def _server_status(server_name: str):
+    # Key is inlined rather than bound so the planner can match the indexed expression
+    return cast(DBBeatmap.status.op('->>')(literal_column(f"'{server_name}'")), Integer)
+
+def custom_ranked_filter(server: str, status: int | None = None) -> List:
+    server_name = _server_name(server)
+    filters = [_server_status(server_name) != _server_status("bancho")]
+    if status is not None:
+        filters.append(_server_status(server_name) == status)
+    else:
+        filters.append(_server_status(server_name) > 0)
+    return filters
+
+def _custom_ranked_index(server_name: str) -> str:
+    table = DBBeatmap.__table__
+    status = table.c.status.name
+    expression = f"(({status} ->> '{server_name}')::integer)"
+    return (
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table.name}_custom_ranked_{server_name} "
+        f"ON {table.name} ({expression}) INCLUDE ({table.c.id.name}, {table.c.set_id.name}) "
+        f"WHERE {expression} <> (({status} ->> 'bancho')::integer)"
+    )
+
+def _stats_temp_date_index() -> str:
+    table = DBStatsTemp.__table__
+    return f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table.name}_date ON {table.name} ({table.c.date.name})"
+
+def get_index_statements() -> Dict[str, str]:
+    # Index name -> statement, partial expression indexes that postgres keeps up to date as beatmaps are upserted
+    statements = dict()
+    for server in servers.servers:
+        if server.server_name != "bancho":
+            server_name = _server_name(server.server_name)
+            statements[f"ix_{DBBeatmap.__table__.name}_custom_ranked_{server_name}"] = _custom_ranked_index(server_name)
+    statements[f"ix_{DBStatsTemp.__table__.name}_date"] = _stats_temp_date_index() # Used by the expired stats sweeper
+    return statements
+
+def _is_invalid(conn, name: str) -> bool:
+    # A failed concurrent build leaves an invalid index behind, and IF NOT EXISTS would skip it forever
+    query = text("SELECT NOT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = :name")
+    return bool(conn.execute(query, {'name': name}).scalar())
+
+def ensure_indexes():
+    with database.engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT") # CONCURRENTLY can't run in a transaction
+        for name, statement in get_index_statements().items():
+            try:
+                if _is_invalid(conn, name):
+                    logger.warning(f"Rebuilding invalid index {name}")
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                conn.execute(text(statement))
+            except Exception as e:
+                logger.warning(f"Failed to create index: {statement}", exc_info=e)
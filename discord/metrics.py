@@ -0,0 +1,224 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Tuple
+from sqlalchemy import event
+
+import threading
+import bisect
+import time
+
+# Name of the command being handled, copied into worker threads by run_blocking
+current_command: ContextVar[str] = ContextVar("current_command", default="none")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    labels = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+class Counter:
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], float] = dict()
+        self.lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def total(self, **match: str) -> float:
+        with self.lock:
+            return sum(value for labels, value in self.values.items() if all(labels[self.labels.index(name)] == wanted for name, wanted in match.items()))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in self.values.items():
+                lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+class Gauge:
+
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...], collect: Callable[[], Dict[Tuple[str, ...], float]]) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.collect().items():
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+class CallbackCounter(Gauge):
+
+    # Read from a value that only ever goes up elsewhere, so rate() works on it
+    kind = "counter"
+
+class Histogram:
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> (per bucket counts, +Inf last, sum)
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = dict()
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        with self.lock:
+            if labels not in self.values:
+                self.values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = self.values[labels]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def quantile(self, q: float, *labels: str) -> float | None:
+        with self.lock:
+            if labels not in self.values:
+                return None
+            counts = list(self.values[labels][0])
+        target = q * sum(counts)
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+    def series(self) -> List[Tuple[str, ...]]:
+        with self.lock:
+            return list(self.values)
+
+    def count(self, *labels: str) -> int:
+        with self.lock:
+            return sum(self.values[labels][0]) if labels in self.values else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, (counts, total) in self.values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else str(bound)
+                    bucket_labels = _format_labels(self.labels, labels, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total[0]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+class Registry:
+
+    def __init__(self) -> None:
+        self.metrics: List[Counter | Gauge | CallbackCounter | Histogram] = list()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = list()
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+command_seconds = registry.register(Histogram("discord_command_seconds", "Time spent handling a command", ("command",)))
+command_errors = registry.register(Counter("discord_command_errors_total", "Commands that failed", ("command", "error")))
+phase_seconds = registry.register(Histogram("discord_phase_seconds", "Time spent per phase of a command", ("command", "phase")))
+
+server_api_seconds = registry.register(Histogram("discord_server_api_seconds", "Time spent waiting on server APIs", ("server", "endpoint")))
+
+def phase(name: str):
+    return phase_seconds.time(current_command.get(), name)
+
+caches: Dict[str, Callable[[], Tuple[int, int]]] = dict()
+
+def register_cache(name: str, get_stats: Callable[[], Tuple[int, int]]):
+    caches[name] = get_stats
+
+def register_gauge(name: str, description: str, get_value: Callable[[], float]):
+    registry.register(Gauge(name, description, (), lambda: {(): get_value()}))
+
+def register_counter(name: str, description: str, get_value: Callable[[], float]):
+    registry.register(CallbackCounter(name, description, (), lambda: {(): get_value()}))
+
+def _cache_stats() -> Dict[Tuple[str, ...], float]:
+    values = dict()
+    for name, get_stats in caches.items():
+        hits, misses = get_stats()
+        values[(name, "hit")] = hits
+        values[(name, "miss")] = misses
+    return values
+
+registry.register(CallbackCounter("discord_cache_requests_total", "Cache lookups by result", ("cache", "result"), _cache_stats))
+
+class TimedMessage:
+
+    # Stands in for the message a command handles, so its replies and edits count as the "discord" phase
+    def __init__(self, message) -> None:
+        self.message = message
+
+    def __getattr__(self, name: str):
+        return getattr(self.message, name)
+
+    async def reply(self, *args, **kwargs) -> "TimedMessage":
+        with phase("discord"):
+            return TimedMessage(await self.message.reply(*args, **kwargs))
+
+    async def edit(self, *args, **kwargs):
+        with phase("discord"):
+            return await self.message.edit(*args, **kwargs)
+
+def instrument_engine(engine):
+    # Times every statement as the "db" phase of whichever command issued it
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Kept on the statement's context, a failed statement never reaches after_cursor_execute
+        context.query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context.query_start
+        phase_seconds.observe(elapsed, current_command.get(), "db")
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(host: str = "127.0.0.1", port: int = 9464) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
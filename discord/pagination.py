@@ -0,0 +1,85 @@
+from common.database.objects import DBScore
+from sqlalchemy.orm import Query, Session
+from sqlalchemy import tuple_
+from typing import Any, Callable, List, Tuple
+
+class KeysetPager:
+
+    # Seeks on (sort column, score id) so every page costs one indexed range scan,
+    # no matter how deep into the results it is. Only the page number and the keys
+    # around it are kept, the query is rebuilt on whichever session each fetch gets
+    def __init__(self, query: Callable[[Session], Query], count: int, length: int, column_name: str = "pp", desc: bool = True, score_of: Callable[[Any], DBScore] = lambda row: row) -> None:
+        self.query = query
+        self.count = count
+        self.length = length
+        self.column_name = column_name
+        self.desc = desc
+        self.score_of = score_of
+        self.page = 0
+        self.first_key: Tuple | None = None
+        self.last_key: Tuple | None = None
+
+    @property
+    def last_page(self) -> int:
+        return max(0, (self.count - 1) // self.length)
+
+    def _columns(self):
+        return getattr(DBScore, self.column_name), DBScore.id
+
+    def _key(self, row: Any) -> Tuple:
+        score = self.score_of(row)
+        return getattr(score, self.column_name), score.id
+
+    def _fetch(self, session: Session, key: Tuple | None, backwards: bool, limit: int, inclusive: bool = False) -> List[Any]:
+        column, tiebreaker = self._columns()
+        descending = self.desc != backwards
+        query = self.query(session)
+        if key is not None:
+            if descending:
+                bound = tuple_(column, tiebreaker) <= tuple_(*key) if inclusive else tuple_(column, tiebreaker) < tuple_(*key)
+            else:
+                bound = tuple_(column, tiebreaker) >= tuple_(*key) if inclusive else tuple_(column, tiebreaker) > tuple_(*key)
+            query = query.filter(bound)
+        if descending:
+            query = query.order_by(column.desc(), tiebreaker.desc())
+        else:
+            query = query.order_by(column.asc(), tiebreaker.asc())
+        rows = query.limit(limit).all()
+        if backwards:
+            rows.reverse()
+        if rows:
+            self.first_key = self._key(rows[0])
+            self.last_key = self._key(rows[-1])
+        return rows
+
+    def current(self, session: Session) -> List[Any]:
+        if self.first_key is None:
+            return self.first(session)
+        return self._fetch(session, self.first_key, False, self.length, inclusive=True)
+
+    def sort_by(self, session: Session, column_name: str, desc: bool) -> List[Any]:
+        self.column_name = column_name
+        self.desc = desc
+        return self.first(session)
+
+    def first(self, session: Session) -> List[Any]:
+        self.page = 0
+        return self._fetch(session, None, False, self.length)
+
+    def next(self, session: Session) -> List[Any]:
+        if self.page >= self.last_page:
+            return self.current(session)
+        self.page += 1
+        return self._fetch(session, self.last_key, False, self.length)
+
+    def prev(self, session: Session) -> List[Any]:
+        if self.page <= 0:
+            return self.current(session)
+        self.page -= 1
+        if self.page == 0:
+            return self.first(session)
+        return self._fetch(session, self.first_key, True, self.length)
+
+    def last(self, session: Session) -> List[Any]:
+        self.page = self.last_page
+        return self._fetch(session, None, True, self.count - self.page * self.length)
@@ -0,0 +1,126 @@
+from common.performance import by_version, SimulatedScore
+from common.logging import get_logger
+from common.app import config
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import bot.discord.metrics as metrics
+import threading
+import pickle
+import time
+import os
+
+logger = get_logger("discord_bot.pp_cache")
+
+# Bump whenever the keys change, saved caches from other versions are discarded
+CACHE_VERSION = 2
+
+class PPCache:
+
+    def __init__(self, maxsize: int = 65536, path: str | None = None) -> None:
+        self.maxsize = maxsize
+        self.path = path
+        # key -> (pp, seconds the calculator took to produce it)
+        self.entries: OrderedDict[Hashable, tuple[float, float]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.time_spent = 0.0
+        self.time_saved = 0.0
+
+    def get(self, key: Hashable) -> float | None:
+        with self.lock:
+            if (entry := self.entries.get(key)) is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.time_saved += entry[1]
+            return entry[0]
+
+    def put(self, key: Hashable, pp: float, elapsed: float):
+        with self.lock:
+            self.time_spent += elapsed
+            self.entries[key] = (pp, elapsed)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def _memo(self, key: Hashable, func: Callable[[], float]) -> float:
+        if (pp := self.get(key)) is not None:
+            return pp
+        start = time.perf_counter()
+        with metrics.phase("pp"):
+            pp = func() or 0 # None would read as a miss and get recalculated every time
+        self.put(key, pp, time.perf_counter() - start)
+        return pp
+
+    def ss_key(self, version: str, beatmap_id: int, mode: int, mods: int) -> Hashable:
+        return ('ss', version, beatmap_id, mode, mods)
+
+    def fc_key(self, version: str, score: Any) -> Hashable:
+        # Mania and ctb pp depend on gekis and katus too
+        return (
+            'fc', version, score.beatmap_id, score.mode, score.mods,
+            score.count_300, score.count_100, score.count_50, score.count_miss, score.count_geki, score.count_katu
+        )
+
+    def simulate(self, version: str, beatmap_id: int, mode: int, mods: int) -> float:
+        if not (pp_system := by_version(version)):
+            return 0
+        key = self.ss_key(version, beatmap_id, mode, mods)
+        return self._memo(key, lambda: pp_system.simulate(SimulatedScore(beatmap_id, mode, mods=mods)))
+
+    def calculate_fc(self, version: str, score: Any, db_score: bool = False) -> float:
+        if not (pp_system := by_version(version)):
+            return 0
+        key = self.fc_key(version, score)
+        if db_score:
+            return self._memo(key, lambda: pp_system.calculate_db_score(score, as_fc=True))
+        return self._memo(key, lambda: pp_system.calculate_score(score, as_fc=True))
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                saved = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Failed to load pp cache from {self.path}", exc_info=e)
+            return
+        if not isinstance(saved, dict) or saved.get('version') != CACHE_VERSION:
+            logger.info(f"Discarding pp cache from {self.path} saved by another cache version")
+            return
+        entries = saved['entries']
+        with self.lock:
+            self.entries.update(entries)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        logger.info(f"Loaded {len(entries)} cached pp values")
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            entries = OrderedDict(self.entries)
+        try:
+            # Per process temporary file, sharded workers share the cache path
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({'version': CACHE_VERSION, 'entries': entries}, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Failed to save pp cache to {self.path}", exc_info=e)
+
+    def get_stats(self) -> dict:
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'time_spent': self.time_spent,
+            'time_saved': self.time_saved,
+        }
+
+pp_cache = PPCache(
+    maxsize=getattr(config, "pp_cache_size", 65536),
+    path=getattr(config, "pp_cache_path", None)
+)
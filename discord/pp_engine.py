@@ -0,0 +1,94 @@
+from common.performance import by_version, SimulatedScore
+from common.api.server_api import Score
+from common.database.objects import DBScore
+from sqlalchemy import inspect
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+from bot.discord.pp_cache import pp_cache
+from common.app import config
+from typing import Any, Dict, List, Tuple
+
+import bot.discord.metrics as metrics
+import multiprocessing
+import asyncio
+import time
+
+_pool: ProcessPoolExecutor | None = None
+# Split between processes when the bot runs sharded across several
+workers: int = getattr(config, "pp_workers", 2)
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Spawn instead of fork, the bot process is full of threads and open connections
+        _pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+def shutdown():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+def _calculate_fc_chunk(items: List[Tuple[str, Score]]) -> List[Tuple[float, float]]:
+    results = list()
+    for version, score in items:
+        start = time.perf_counter()
+        pp = 0
+        if (pp_system := by_version(version)):
+            pp = pp_system.calculate_score(score, as_fc=True) or 0
+        results.append((pp, time.perf_counter() - start))
+    return results
+
+def db_score_values(score: DBScore) -> Dict[str, Any]:
+    # Plain column values, ORM rows don't belong in another process
+    return {attr.key: getattr(score, attr.key) for attr in inspect(DBScore).column_attrs}
+
+def _calculate_db_fc_chunk(items: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[float, float]]:
+    results = list()
+    for version, values in items:
+        start = time.perf_counter()
+        pp = 0
+        if (pp_system := by_version(version)):
+            pp = pp_system.calculate_db_score(DBScore(**values), as_fc=True) or 0
+        results.append((pp, time.perf_counter() - start))
+    return results
+
+def _simulate_chunk(items: List[Tuple[str, int, int, int]]) -> List[Tuple[float, float]]:
+    results = list()
+    for version, beatmap_id, mode, mods in items:
+        start = time.perf_counter()
+        pp = 0
+        if (pp_system := by_version(version)):
+            pp = pp_system.simulate(SimulatedScore(beatmap_id, mode, mods=mods)) or 0
+        results.append((pp, time.perf_counter() - start))
+    return results
+
+async def _run_batch(func, keys: list, items: list, chunk_size: int) -> List[float]:
+    results: List[float | None] = [pp_cache.get(key) for key in keys]
+    missing = [i for i, pp in enumerate(results) if pp is None]
+    if not missing:
+        return results
+    loop = asyncio.get_running_loop()
+    chunks = [missing[i:i+chunk_size] for i in range(0, len(missing), chunk_size)]
+    futures = [loop.run_in_executor(get_pool(), func, [items[i] for i in chunk]) for chunk in chunks]
+    with metrics.phase("pp"):
+        batch_results = await asyncio.gather(*futures)
+    for chunk, chunk_results in zip(chunks, batch_results):
+        for i, (pp, elapsed) in zip(chunk, chunk_results):
+            pp_cache.put(keys[i], pp, elapsed)
+            results[i] = pp
+    return results
+
+async def calculate_fc(items: List[Tuple[str, Score]], chunk_size: int = 10) -> List[float]:
+    keys = [pp_cache.fc_key(version, score) for version, score in items]
+    return await _run_batch(_calculate_fc_chunk, keys, items, chunk_size)
+
+async def calculate_db_fc(items: List[Tuple[str, Dict[str, Any]]], chunk_size: int = 10) -> List[float]:
+    keys = [pp_cache.fc_key(version, SimpleNamespace(**values)) for version, values in items]
+    return await _run_batch(_calculate_db_fc_chunk, keys, items, chunk_size)
+
+async def simulate(items: List[Tuple[str, int, int, int]], chunk_size: int = 10) -> List[float]:
+    keys = [pp_cache.ss_key(*item) for item in items]
+    return await _run_batch(_simulate_chunk, keys, items, chunk_size)
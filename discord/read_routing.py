@@ -0,0 +1,69 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager, contextmanager
+from common.logging import get_logger
+from common.app import config, database
+from typing import AsyncIterator, Iterator
+
+import bot.discord.async_database as async_database
+import bot.discord.metrics as metrics
+import time
+
+logger = get_logger("discord_bot.read_routing")
+
+class ReplicaHealth:
+
+    # After a failed connection reads go to the primary for a while instead of retrying every time
+    def __init__(self, retry_after: float = 30) -> None:
+        self.retry_after = retry_after
+        self.down_until = 0.0
+        self.fallbacks = 0
+
+    @property
+    def available(self) -> bool:
+        return getattr(database, "engine_ro", None) is not None and time.monotonic() >= self.down_until
+
+    def mark_down(self, e: BaseException):
+        logger.warning(f"Read replica unavailable, using the primary for {self.retry_after}s: {e}")
+        self.down_until = time.monotonic() + self.retry_after
+
+replica = ReplicaHealth(getattr(config, "database_replica_retry_after", 30))
+
+metrics.register_counter("discord_db_replica_fallbacks_total", "Reads sent to the primary because the replica was down", lambda: replica.fallbacks)
+
+@contextmanager
+def read_session() -> Iterator[Session]:
+    if replica.available:
+        session = Session(bind=database.engine_ro)
+        try:
+            session.connection()
+        except (DBAPIError, OSError) as e:
+            session.close()
+            replica.mark_down(e)
+        else:
+            try:
+                yield session
+            finally:
+                session.close()
+            return
+    replica.fallbacks += 1
+    with database.managed_session() as session:
+        yield session
+
+@asynccontextmanager
+async def async_read_session() -> AsyncIterator[AsyncSession]:
+    if replica.available:
+        try:
+            session = await async_database.open_session("replica")
+        except (DBAPIError, OSError) as e:
+            replica.mark_down(e)
+        else:
+            try:
+                yield session
+            finally:
+                await session.close()
+            return
+    replica.fallbacks += 1
+    async with async_database.managed_session() as session:
+        yield session
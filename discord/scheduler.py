@@ -0,0 +1,94 @@
+from common.logging import get_logger
+from common.app import config
+from typing import Awaitable, Callable, Dict, Hashable, Set
+
+import asyncio
+
+logger = get_logger("discord_bot.scheduler")
+
+# Outcomes of CommandScheduler.submit
+RAN = "ran"
+DEDUPLICATED = "deduplicated"
+REJECTED = "rejected" # User already has too many commands running
+BUSY = "busy" # Waited too long for a guild or heavy slot
+
+class CommandScheduler:
+
+    def __init__(self, per_user: int = 2, per_guild: int = 8, heavy: int = 2, wait_timeout: float = 10) -> None:
+        self.per_user = per_user
+        self.per_guild = per_guild
+        self.wait_timeout = wait_timeout
+        self.user_running: Dict[int, int] = dict()
+        self.guild_slots: Dict[int, asyncio.Semaphore] = dict()
+        # Commands holding or waiting for each guild's slots, the semaphore goes away at 0
+        self.guild_users: Dict[int, int] = dict()
+        # Separate lane so !query, !getfile and no-choke !top can't starve !recent or !ping
+        self.heavy_slots = asyncio.Semaphore(heavy)
+        self.in_flight: Set[Hashable] = set()
+        self.deduplicated = 0
+        self.rejected = 0
+
+    async def _acquire(self, slots: asyncio.Semaphore) -> bool:
+        try:
+            await asyncio.wait_for(slots.acquire(), self.wait_timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _run(self, guild_id: int | None, heavy: bool, func: Callable[[], Awaitable[None]]) -> str:
+        if not guild_id:
+            guild_slots = None
+        elif not (guild_slots := self.guild_slots.get(guild_id)):
+            guild_slots = self.guild_slots[guild_id] = asyncio.Semaphore(self.per_guild)
+        if guild_slots:
+            self.guild_users[guild_id] = self.guild_users.get(guild_id, 0) + 1
+        try:
+            if guild_slots and not await self._acquire(guild_slots):
+                return BUSY
+            try:
+                if heavy:
+                    if not await self._acquire(self.heavy_slots):
+                        return BUSY
+                    try:
+                        await func()
+                    finally:
+                        self.heavy_slots.release()
+                else:
+                    await func()
+            finally:
+                if guild_slots:
+                    guild_slots.release()
+        finally:
+            if guild_slots:
+                self.guild_users[guild_id] -= 1
+                if not self.guild_users[guild_id]:
+                    del self.guild_users[guild_id]
+                    del self.guild_slots[guild_id]
+        return RAN
+
+    async def submit(self, key: Hashable, user_id: int, guild_id: int | None, heavy: bool, func: Callable[[], Awaitable[None]]) -> str:
+        if key in self.in_flight:
+            # Same command from the same user is already running, its reply covers this one too
+            self.deduplicated += 1
+            return DEDUPLICATED
+        if self.user_running.get(user_id, 0) >= self.per_user:
+            self.rejected += 1
+            return REJECTED
+        self.in_flight.add(key)
+        self.user_running[user_id] = self.user_running.get(user_id, 0) + 1
+        try:
+            if (result := await self._run(guild_id, heavy, func)) == BUSY:
+                self.rejected += 1
+            return result
+        finally:
+            self.in_flight.discard(key)
+            self.user_running[user_id] -= 1
+            if not self.user_running[user_id]:
+                del self.user_running[user_id]
+
+scheduler = CommandScheduler(
+    per_user=getattr(config, "discord_per_user_commands", 2),
+    per_guild=getattr(config, "discord_per_guild_commands", 8),
+    heavy=getattr(config, "discord_heavy_commands", 2),
+    wait_timeout=getattr(config, "discord_command_wait_timeout", 10)
+)
@@ -0,0 +1,131 @@
+from multiprocessing.connection import wait
+from bot.discord.cache import prefixes, links
+from common.logging import get_logger
+from common.app import config
+from typing import Any, Dict, List, Tuple
+
+import multiprocessing
+import threading
+import asyncio
+import math
+import aiohttp
+import queue
+import time
+
+logger = get_logger("discord_bot.sharding")
+
+IDENTIFY_INTERVAL = 5
+
+def split_shards(shard_count: int, processes: int) -> List[List[int]]:
+    # Contiguous ranges, the first ones get an extra shard when it doesn't divide evenly
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    ranges = list()
+    start = 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+def gateway_info(token: str) -> Tuple[int, int]:
+    # Recommended shard count and how many shards may identify per 5 seconds
+    async def fetch() -> Tuple[int, int]:
+        async with aiohttp.ClientSession() as session:
+            async with session.get("https://discord.com/api/v10/gateway/bot", headers={"Authorization": f"Bot {token}"}) as response:
+                response.raise_for_status()
+                data = await response.json()
+                return data['shards'], data['session_start_limit']['max_concurrency']
+    return asyncio.run(fetch())
+
+def identify_delay(shard_count: int, max_concurrency: int) -> float:
+    # Discord lets max_concurrency shards identify every 5 seconds, across all processes
+    return IDENTIFY_INTERVAL * math.ceil(shard_count / max_concurrency)
+
+class CacheBroker:
+
+    # Local stand-in for a message broker, workers publish to one queue and
+    # a thread in the launcher fans every event out to all the other workers
+    def __init__(self, context) -> None:
+        self.context = context
+        self.inbox = context.Queue()
+        self.outboxes: Dict[int, Any] = dict()
+
+    def outbox(self, worker: int):
+        if worker not in self.outboxes:
+            self.outboxes[worker] = self.context.Queue()
+        return self.outboxes[worker]
+
+    def run(self, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                worker, event = self.inbox.get(timeout=1)
+            except queue.Empty:
+                continue
+            for other, outbox in list(self.outboxes.items()):
+                if other != worker:
+                    outbox.put(event)
+
+def _apply(event: Tuple):
+    if event[0] == "prefix":
+        prefixes.set(event[1], event[2], notify=False)
+    elif event[0] == "link":
+        links.invalidate(event[1], notify=False)
+
+def _subscribe(outbox):
+    while True:
+        _apply(outbox.get())
+
+def connect(worker: int, inbox, outbox):
+    prefixes.listeners.append(lambda guild_id, prefix: inbox.put((worker, ("prefix", guild_id, prefix))))
+    links.listeners.append(lambda discord_id: inbox.put((worker, ("link", discord_id))))
+    threading.Thread(target=_subscribe, args=(outbox,), name="cache_subscriber", daemon=True).start()
+
+def _worker(worker: int, processes: int, shard_ids: List[int], shard_count: int, inbox, outbox):
+    import bot.discord.bot as bot_module # Fresh interpreter, avoids importing the bot in the launcher
+    import bot.discord.pp_engine as pp_engine
+    connect(worker, inbox, outbox)
+    # pp_workers is for the whole bot, not for each process
+    pp_engine.workers = max(1, pp_engine.workers // processes)
+    # Every worker needs its own port for the metrics endpoint, the first one sweeps stats and saves the pp cache
+    port = getattr(config, "discord_metrics_port", 9464)
+    bot_module.run_bot(port + worker if port else None, primary=worker == 0, shard_ids=shard_ids, shard_count=shard_count)
+
+def launch(processes: int, shard_count: int | None = None, restart_delay: float = 5):
+    recommended, max_concurrency = gateway_info(config.discord_token)
+    if shard_count is None:
+        shard_count = recommended
+    context = multiprocessing.get_context("spawn")
+    broker = CacheBroker(context)
+    stop = threading.Event()
+    threading.Thread(target=broker.run, args=(stop,), name="cache_broker", daemon=True).start()
+
+    workers: Dict[int, Tuple[Any, List[int]]] = dict()
+    def start(worker: int, shard_ids: List[int]):
+        process = context.Process(target=_worker, args=(worker, processes, shard_ids, shard_count, broker.inbox, broker.outbox(worker)), name=f"discord_bot_{worker}")
+        process.start()
+        workers[worker] = (process, shard_ids)
+        logger.info(f"Started worker {worker} (pid {process.pid}) with shards {shard_ids[0]}-{shard_ids[-1]} of {shard_count}")
+
+    ranges = split_shards(shard_count, processes)
+    processes = len(ranges)
+    try:
+        for worker, shard_ids in enumerate(ranges):
+            if worker:
+                # Give the previous worker's shards time to identify before the next one starts its own
+                time.sleep(identify_delay(len(ranges[worker - 1]), max_concurrency))
+            start(worker, shard_ids)
+        while workers:
+            wait([process.sentinel for process, _ in workers.values()])
+            for worker, (process, shard_ids) in list(workers.items()):
+                if process.is_alive():
+                    continue
+                del workers[worker]
+                if process.exitcode != 0: # Crashed, bring its shards back up
+                    logger.warning(f"Worker {worker} exited with code {process.exitcode}, restarting in {restart_delay}s")
+                    time.sleep(restart_delay)
+                    start(worker, shard_ids)
+    finally:
+        stop.set()
+        for process, _ in workers.values():
+            process.terminate()
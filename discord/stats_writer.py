@@ -0,0 +1,70 @@
+from common.database.objects import DBStatsTemp
+from common.logging import get_logger
+from common.app import database
+from datetime import datetime, timedelta
+from typing import Dict, Tuple
+
+import threading
+
+logger = get_logger("discord_bot.stats_writer")
+
+STATS_TEMP_LIFETIME = timedelta(days=1)
+
+class StatsSnapshotWriter:
+
+    def __init__(self, max_pending: int = 500) -> None:
+        self.max_pending = max_pending
+        self.pending: Dict[Tuple, DBStatsTemp] = dict()
+        self.lock = threading.Lock()
+        self.flush_event = threading.Event()
+
+    def add(self, snapshot: DBStatsTemp):
+        key = (snapshot.server, snapshot.user_id, snapshot.mode, snapshot.relax, snapshot.discord_id)
+        with self.lock:
+            if key in self.pending: # Same user checked again before the last flush, keep the older one
+                return
+            self.pending[key] = snapshot
+            if len(self.pending) >= self.max_pending:
+                self.flush_event.set()
+
+    def flush(self):
+        with self.lock:
+            batch = self.pending
+            self.pending = dict()
+            self.flush_event.clear()
+        if not batch:
+            return
+        try:
+            with database.managed_session() as session:
+                for snapshot in batch.values():
+                    session.merge(snapshot)
+                session.commit()
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} temporary stats, retrying on the next flush", exc_info=e)
+            with self.lock: # Same rule as add, the older snapshot from the batch wins
+                self.pending = {**self.pending, **batch}
+
+    def sweep(self) -> int:
+        with database.managed_session() as session:
+            deleted = session.query(DBStatsTemp).filter(
+                DBStatsTemp.date < datetime.now() - STATS_TEMP_LIFETIME
+            ).delete(synchronize_session=False)
+            session.commit()
+        return deleted
+
+    # sweep_interval None leaves sweeping to another process
+    def run(self, stop: threading.Event, flush_interval: float = 5, sweep_interval: float | None = 600):
+        last_sweep = 0.0
+        while not stop.is_set():
+            self.flush_event.wait(flush_interval)
+            try:
+                self.flush()
+                if sweep_interval is not None and (now := datetime.now().timestamp()) - last_sweep > sweep_interval:
+                    last_sweep = now
+                    if (deleted := self.sweep()):
+                        logger.info(f"Deleted {deleted} expired temporary stats")
+            except Exception as e:
+                logger.error("Failed to write temporary stats!", exc_info=e)
+        self.flush()
+
+stats_writer = StatsSnapshotWriter()
@@ -0,0 +1,85 @@
+from bot.discord.benchmarks.fakes import FakeAuthor, FakeMessage, FakeServer
+from bot.discord.commands import Command
+from bot.discord.cache import user_ids
+from types import SimpleNamespace
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+import bot.discord.cached_servers as servers
+
+class RecordingServer(FakeServer):
+
+    def __init__(self, server_name: str) -> None:
+        super().__init__(server_name, [1], latency=0, jitter=0)
+        self.lookups = list()
+
+    def get_user_info(self, user, mode: int = 0, relax: int = 0):
+        self.lookups.append(user)
+        return super().get_user_info(user, mode, relax)
+
+class ResolveContextTest(IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.servers = {name: RecordingServer(name) for name in ("akatsuki", "gatari")}
+        by_name = patch.object(servers, "by_name", lambda name: self.servers.get(name))
+        by_name.start()
+        self.addCleanup(by_name.stop)
+        user_ids.clear()
+        self.addCleanup(user_ids.clear)
+        self.command = Command("test")
+        self.link = None
+        self.command._get_link = lambda message: self.link
+
+    async def resolve(self, *args: str):
+        message = FakeMessage("!test", FakeAuthor(1, "tester"), None)
+        context = await self.command._resolve_context(message, self.command._parse_args(list(args)))
+        return context, message
+
+    def link_on(self, **links: int):
+        self.link = SimpleNamespace(default_server=next(iter(links)), links=links, default_mode=1, default_relax=0)
+
+    async def test_explicit_server(self):
+        context, message = await self.resolve("user5", "-server", "gatari")
+        self.assertIs(context.server, self.servers["gatari"])
+        self.assertEqual(context.user.id, 5)
+        self.assertEqual((context.mode, context.relax), (0, 0))
+        self.assertFalse(message.replies)
+
+    async def test_linked_default_server(self):
+        self.link_on(gatari=7)
+        context, _ = await self.resolve()
+        self.assertIs(context.server, self.servers["gatari"])
+        self.assertEqual(context.user.id, 7)
+        self.assertEqual((context.mode, context.relax), (1, 0))
+        self.assertIs(context.link, self.link)
+
+    async def test_unlinked_user(self):
+        context, message = await self.resolve()
+        self.assertIsNone(context)
+        self.assertIn("requires a link", message.replies[0]['content'])
+
+    async def test_unknown_server(self):
+        context, message = await self.resolve("user5", "-server", "nowhere")
+        self.assertIsNone(context)
+        self.assertIn("Unknown server", message.replies[0]['content'])
+        self.assertFalse(self.servers["akatsuki"].lookups)
+
+    async def test_linked_but_not_on_selected_server(self):
+        self.link_on(gatari=7)
+        context, message = await self.resolve("-server", "akatsuki")
+        self.assertIsNone(context)
+        self.assertIn("requires a link", message.replies[0]['content'])
+        self.assertFalse(self.servers["akatsuki"].lookups)
+
+    async def test_unknown_user(self):
+        context, message = await self.resolve("nobody", "-server", "akatsuki")
+        self.assertIsNone(context)
+        self.assertEqual(message.replies[0]['content'], "User not found on akatsuki!")
+
+    async def test_username_cached_as_id(self):
+        await self.resolve("user9", "-server", "akatsuki")
+        context, _ = await self.resolve("user9", "-server", "akatsuki")
+        self.assertEqual(context.user.id, 9)
+        # The second lookup goes by the id the first one resolved
+        self.assertEqual(self.servers["akatsuki"].lookups, ["user9", 9])
+        self.assertEqual(user_ids.get(("akatsuki", "user9")), 9)
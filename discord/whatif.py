@@ -0,0 +1,64 @@
+from typing import List, Tuple
+
+import bisect
+import heapq
+
+MAX_PLAYS = 100
+WEIGHTS = [0.95 ** i for i in range(MAX_PLAYS)]
+# WEIGHT_SUMS[i] is the sum of the first i weights
+WEIGHT_SUMS = [0.0]
+for weight in WEIGHTS:
+    WEIGHT_SUMS.append(WEIGHT_SUMS[-1] + weight)
+BONUS_PP_MAX = 416.32
+
+class WhatIfEngine:
+
+    def __init__(self, top_plays: List[float]) -> None:
+        self.plays = sorted(top_plays, reverse=True)[:MAX_PLAYS]
+        self.ascending = self.plays[::-1]
+        # suffix[i] is the weighted sum of plays[i:], so shifting plays down is a multiply
+        self.suffix = [0.0] * (len(self.plays) + 1)
+        for i in range(len(self.plays) - 1, -1, -1):
+            self.suffix[i] = self.suffix[i+1] + self.plays[i] * WEIGHTS[i]
+        self.total = self.suffix[0]
+
+    def rank(self, pp: float) -> int:
+        # Number of plays that would be at least as good, the new play is ranked after ties
+        return len(self.plays) - bisect.bisect_left(self.ascending, pp) + 1
+
+    def total_with(self, pp: float, count: int = 1) -> float:
+        n = len(self.plays)
+        position = n - bisect.bisect_left(self.ascending, pp)
+        if position >= MAX_PLAYS or count <= 0:
+            return self.total
+        end = min(position + count, MAX_PLAYS)
+        added = pp * (WEIGHT_SUMS[end] - WEIGHT_SUMS[position])
+        shift = end - position
+        # Plays pushed past the 100th slot stop counting
+        cutoff = max(position, min(n, MAX_PLAYS - shift))
+        shifted = (0.95 ** shift) * (self.suffix[position] - self.suffix[cutoff])
+        return self.suffix[0] - self.suffix[position] + added + shifted
+
+    def gain_curve(self, values: List[float], count: int = 1) -> List[float]:
+        return [self.total_with(pp, count) - self.total for pp in values]
+
+    def total_with_plays(self, plays: List[Tuple[int, float]]) -> float:
+        if len(plays) == 1:
+            return self.total_with(plays[0][1], plays[0][0])
+        added = sorted((pp for count, pp in plays for _ in range(count)), reverse=True)
+        merged = heapq.merge(self.plays, added, reverse=True)
+        return sum(pp * weight for pp, weight in zip(merged, WEIGHTS))
+
+    def required_pp(self, target_gain: float, count: int = 1) -> float:
+        if target_gain <= 0:
+            return 0
+        low, high = 0.0, max(self.plays[0] if self.plays else 0, 0) + target_gain
+        while self.total_with(high, count) - self.total < target_gain:
+            high *= 2
+        for _ in range(50):
+            middle = (low + high) / 2
+            if self.total_with(middle, count) - self.total < target_gain:
+                low = middle
+            else:
+                high = middle
+        return high